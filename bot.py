@@ -7,23 +7,36 @@ from telegram.ext import (
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters,
     ContextTypes
 )
 from telegram.constants import ParseMode
 
 from config import config
-from database.connection import get_database
+from database.storage import get_storage, close_storage
+from database.settings_cache import settings_cache
+from database.write_behind import write_behind
 from database.operations import init_user_settings, get_user_settings
 from handlers.start import start_command, help_command
 from handlers.settings import settings_command, settings_callback
+from handlers.stats import stats_command
 from handlers.video import video_handler, video_callback
 from handlers.audio import audio_handler, audio_callback
 from handlers.document import document_handler, document_callback
 from handlers.bulk import bulk_handler, bulk_callback
 from handlers.callback import handle_callback
-from utils.premium import check_premium_status, apply_wait_time
-from utils.helpers import cleanup_temp_files
+from utils.premium import check_premium_status, apply_wait_time, begin_update
+from utils.admission import admission
+from utils.scheduler import scheduler
+from utils.streaming import streaming
+from utils.download_cache import download_cache
+from utils.downloader import downloader
+from utils.mtproto import mtproto
+from utils.progress import progress
+from utils.rate_limiter import rate_limiter
+from utils.webhook import RecentUpdates, TrackingUpdateProcessor
+from utils.workspace import workspaces
 
 # Configure logging
 logging.basicConfig(
@@ -35,14 +48,15 @@ logger = logging.getLogger(__name__)
 class TelegramMediaBot:
     def __init__(self):
         self.application = None
+        self.update_processor = TrackingUpdateProcessor()
         self.user_sessions: Dict[int, Dict[str, Any]] = {}
         
     async def init_db(self):
         """Initialize database connection"""
         try:
-            db = await get_database()
-            logger.info("Database connection established")
-            return db
+            storage = await get_storage()
+            logger.info(f"Storage backend ready: {config.STORAGE_BACKEND}")
+            return storage
         except Exception as e:
             logger.error(f"Failed to connect to database: {e}")
             raise
@@ -62,38 +76,50 @@ class TelegramMediaBot:
     
     async def check_user_limit(self, user_id: int) -> bool:
         """Check if user has reached concurrent job limit"""
-        user_jobs = sum(1 for session in self.user_sessions.values() 
-                       if session.get('user_id') == user_id and session.get('processing'))
-        return user_jobs < config.MAX_CONCURRENT_JOBS
+        return admission.active_jobs(user_id) < config.MAX_CONCURRENT_JOBS
     
     async def download_progress(self, current, total, update, context, file_type):
         """Handle download progress updates"""
         try:
-            progress = (current / total) * 100
-            if int(progress) % 10 == 0:  # Update every 10%
-                await update.effective_chat.send_message(
-                    f"⬇️ Downloading {file_type}: {progress:.1f}%"
-                )
+            await self.report_progress(update, context, f"⬇️ Downloading {file_type}", current, total)
         except Exception as e:
             logger.error(f"Error in download progress: {e}")
     
     async def upload_progress(self, current, total, update, context, file_type):
         """Handle upload progress updates"""
         try:
-            progress = (current / total) * 100
-            if int(progress) % 10 == 0:  # Update every 10%
-                await update.effective_chat.send_message(
-                    f"⬆️ Uploading {file_type}: {progress:.1f}%"
-                )
+            await self.report_progress(update, context, f"⬆️ Uploading {file_type}", current, total)
         except Exception as e:
             logger.error(f"Error in upload progress: {e}")
     
+    async def report_progress(self, update, context, label, current, total):
+        """Keep one status message per transfer and edit it in place"""
+        key = f"progress:{label}"
+        percentage = (current / total) * 100 if total else 100
+        text = f"{label}: {percentage:.0f}%"
+        message_id = context.chat_data.get(key)
+        
+        if message_id is None:
+            message = await update.effective_chat.send_message(text)
+            context.chat_data[key] = message.message_id
+            return
+        
+        done = current >= total
+        await progress.edit(update.effective_chat.id, message_id, text, final=done)
+        if done:
+            progress.forget(update.effective_chat.id, message_id)
+            context.chat_data.pop(key, None)
+    
     def setup_handlers(self):
         """Setup all bot handlers"""
+        # Runs before every other group so tier lookups are memoized per update
+        self.application.add_handler(TypeHandler(Update, begin_update), group=-1)
+        
         # Command handlers
         self.application.add_handler(CommandHandler("start", start_command))
         self.application.add_handler(CommandHandler("help", help_command))
         self.application.add_handler(CommandHandler("settings", settings_command))
+        self.application.add_handler(CommandHandler("stats", stats_command))
         
         # Message handlers
         self.application.add_handler(MessageHandler(
@@ -119,41 +145,93 @@ class TelegramMediaBot:
     
     async def cleanup(self):
         """Cleanup resources"""
-        await cleanup_temp_files()
+        await scheduler.stop()
+        await settings_cache.stop()
+        await admission.stop()
+        await write_behind.stop()
+        await close_storage()
+        await downloader.close()
+        await streaming.close()
+        await mtproto.stop()
+        workspaces.sweep()
         logger.info("Cleanup completed")
     
     async def run_webhook(self):
-        """Run bot with webhook (for Koyeb)"""
+        """Run bot with webhook (for Koyeb).
+
+        The endpoint only validates, deduplicates and enqueues; the
+        application's own update fetcher drains the update queue into the
+        (concurrent) handlers. Answering before any handler runs keeps
+        Telegram from timing out and redelivering slow updates. Once
+        WEBHOOK_QUEUE_SIZE accepted updates are unfinished, new ones get a 503.
+        """
+        await self.application.initialize()
         await self.application.bot.set_webhook(
             url=f"{config.WEBHOOK_URL}/{config.BOT_TOKEN}",
-            drop_pending_updates=True
+            drop_pending_updates=True,
+            secret_token=config.WEBHOOK_SECRET or None
         )
+        await self.application.start()
         
         # Start web server
-        from fastapi import FastAPI, Request
+        from fastapi import FastAPI, Request, Response
         import uvicorn
         
         app = FastAPI()
+        update_queue = self.application.update_queue
+        processor = self.update_processor
+        recent = RecentUpdates()
         
         @app.post(f"/{config.BOT_TOKEN}")
         async def process_webhook(request: Request):
-            data = await request.json()
-            update = Update.de_json(data, self.application.bot)
-            await self.application.process_update(update)
+            if config.WEBHOOK_SECRET and \
+                    request.headers.get("X-Telegram-Bot-Api-Secret-Token") != config.WEBHOOK_SECRET:
+                return Response(status_code=403)
+            
+            try:
+                data = await request.json()
+                update_id = int(data["update_id"])
+                update = Update.de_json(data, self.application.bot)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return Response(status_code=400)
+            
+            # A redelivery of something already queued or handled
+            if recent.duplicate(update_id):
+                return {"status": "ok"}
+            
+            if processor.in_flight >= config.WEBHOOK_QUEUE_SIZE:
+                # Telegram retries non-2xx answers later, which is our backpressure;
+                # the id stays unrecorded so that retry is accepted
+                return Response(status_code=503)
+            processor.accept(update_id)
+            update_queue.put_nowait(update)
+            recent.add(update_id)
             return {"status": "ok"}
         
         @app.get("/")
         async def health_check():
-            return {"status": "healthy", "bot": config.BOT_USERNAME}
+            return {
+                "status": "healthy",
+                "bot": config.BOT_USERNAME,
+                "update_queue": update_queue.qsize(),
+                "updates_in_flight": processor.in_flight,
+                "duplicate_updates": recent.duplicates,
+                "download_cache": download_cache.stats(),
+                "settings_cache": settings_cache.stats()
+            }
         
-        config = uvicorn.Config(
+        server_config = uvicorn.Config(
             app,
             host=config.HOST,
             port=config.PORT,
             log_level="info"
         )
-        server = uvicorn.Server(config)
-        await server.serve()
+        server = uvicorn.Server(server_config)
+        try:
+            await server.serve()
+        finally:
+            await self.application.stop()
+            await self.application.shutdown()
     
     async def run_polling(self):
         """Run bot with polling (for development)"""
@@ -168,16 +246,30 @@ class TelegramMediaBot:
         """Start the bot"""
         # Initialize database
         await self.init_db()
+        workspaces.sweep()
+        settings_cache.start()
+        await admission.start()
+        write_behind.start()
         
         # Create Application
         self.application = Application.builder() \
             .token(config.BOT_TOKEN) \
-            .concurrent_updates(True) \
+            .base_url(f"{config.BOT_API_URL}/bot") \
+            .base_file_url(f"{config.BOT_API_URL}/file/bot") \
+            .local_mode(config.BOT_API_LOCAL_MODE) \
+            .concurrent_updates(self.update_processor) \
+            .rate_limiter(rate_limiter) \
             .build()
         
+        # Progress messages share the application's bot and connection pool
+        progress.bind(self.application.bot)
+        
         # Setup handlers
         self.setup_handlers()
         
+        # Start FFmpeg job workers
+        await scheduler.start()
+        
         # Start bot
         if use_webhook and config.WEBHOOK_URL:
             logger.info("Starting bot with webhook...")
@@ -1,5 +1,5 @@
 import os
-from typing import Dict, List, Any
+from typing import Dict, FrozenSet, List, Any
 from dataclasses import dataclass
 from dotenv import load_dotenv
 
@@ -10,25 +10,89 @@ class Config:
     # Bot Configuration
     BOT_TOKEN: str = os.getenv("BOT_TOKEN")
     BOT_USERNAME: str = os.getenv("BOT_USERNAME", "").strip("@")
+    BOT_API_URL: str = os.getenv("BOT_API_URL", "https://api.telegram.org").rstrip("/")  # self-hosted Bot API server for files over 20MB
+    BOT_API_LOCAL_MODE: bool = os.getenv("BOT_API_LOCAL_MODE", "false").lower() == "true"  # server shares our filesystem
+    MTPROTO_API_ID: int = int(os.getenv("MTPROTO_API_ID", 0))  # from my.telegram.org; enables MTProto uploads
+    MTPROTO_API_HASH: str = os.getenv("MTPROTO_API_HASH", "")
+    MTPROTO_UPLOAD_THRESHOLD: int = int(os.getenv("MTPROTO_UPLOAD_THRESHOLD", 20 * 1024 * 1024))  # smaller files use the Bot API
+    MTPROTO_CONNECTIONS: int = int(os.getenv("MTPROTO_CONNECTIONS", 4))  # concurrent upload transmissions
+    MTPROTO_RETRY_INTERVAL: float = float(os.getenv("MTPROTO_RETRY_INTERVAL", 600))  # seconds on the Bot API after the client fails to start
     
     # MongoDB Configuration
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     MONGO_DB: str = os.getenv("MONGO_DB", "telegram_bot")
     
+    # Storage Backend
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "mongo").lower()  # mongo or sqlite
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "./data/bot.db")
+    HISTORY_RETENTION_DAYS: int = int(os.getenv("HISTORY_RETENTION_DAYS", 90))  # raw history; rollups are kept
+    
     # Premium Settings
-    PREMIUM_USER_IDS: List[int] = list(map(int, os.getenv("PREMIUM_USER_IDS", "").split(","))) if os.getenv("PREMIUM_USER_IDS") else []
+    PREMIUM_USER_IDS: FrozenSet[int] = frozenset(map(int, os.getenv("PREMIUM_USER_IDS", "").split(","))) if os.getenv("PREMIUM_USER_IDS") else frozenset()
+    PREMIUM_CACHE_TTL: int = int(os.getenv("PREMIUM_CACHE_TTL", 60))  # seconds
+    PREMIUM_CACHE_SIZE: int = int(os.getenv("PREMIUM_CACHE_SIZE", 10000))
+    ADMIN_USER_IDS: FrozenSet[int] = frozenset(map(int, os.getenv("ADMIN_USER_IDS", "").split(","))) if os.getenv("ADMIN_USER_IDS") else frozenset()
     FREE_USER_WAIT_TIME: int = int(os.getenv("FREE_USER_WAIT_TIME", 1800))  # 30 minutes in seconds
     MAX_FILE_SIZE_FREE: int = int(os.getenv("MAX_FILE_SIZE_FREE", 500 * 1024 * 1024))  # 500MB
     MAX_FILE_SIZE_PREMIUM: int = int(os.getenv("MAX_FILE_SIZE_PREMIUM", 2 * 1024 * 1024 * 1024))  # 2GB
     
     # Processing Settings
     MAX_CONCURRENT_JOBS: int = int(os.getenv("MAX_CONCURRENT_JOBS", 5))
+    FFMPEG_WORKERS: int = int(os.getenv("FFMPEG_WORKERS", os.cpu_count() or 1))
+    DEFAULT_JOB_ESTIMATE: int = int(os.getenv("DEFAULT_JOB_ESTIMATE", 30))  # seconds, until real timings exist
     TEMP_DIR: str = os.getenv("TEMP_DIR", "./temp")
     OUTPUT_DIR: str = os.getenv("OUTPUT_DIR", "./output")
+    CACHE_DIR: str = os.getenv("CACHE_DIR", "./cache")
+    WORKSPACE_DIR: str = os.getenv("WORKSPACE_DIR", os.path.join(os.getenv("TEMP_DIR", "./temp"), "jobs"))
+    WORKSPACE_TMPFS_DIR: str = os.getenv("WORKSPACE_TMPFS_DIR", "")  # e.g. /dev/shm; empty disables
+    WORKSPACE_TMPFS_MAX_SIZE: int = int(os.getenv("WORKSPACE_TMPFS_MAX_SIZE", 64 * 1024 * 1024))  # largest input kept in RAM
+    DISK_BUDGET: int = int(os.getenv("DISK_BUDGET", 0))  # bytes reserved by running jobs; 0 = derive from free space
+    DISK_HEADROOM: float = float(os.getenv("DISK_HEADROOM", 0.1))  # fraction of free space left alone when deriving it
+    CACHE_MAX_SIZE: int = int(os.getenv("CACHE_MAX_SIZE", 10 * 1024 * 1024 * 1024))  # 10GB
+    DOWNLOAD_CHUNK_SIZE: int = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 1024 * 1024))  # bytes held in memory per download
+    DOWNLOAD_READ_TIMEOUT: float = float(os.getenv("DOWNLOAD_READ_TIMEOUT", 60))  # seconds without data before giving up
+    DOWNLOAD_CONNECTIONS: int = int(os.getenv("DOWNLOAD_CONNECTIONS", 4))  # parallel ranges per download
+    DOWNLOAD_RANGE_SIZE: int = int(os.getenv("DOWNLOAD_RANGE_SIZE", 16 * 1024 * 1024))
+    DOWNLOAD_PARALLEL_MIN_SIZE: int = int(os.getenv("DOWNLOAD_PARALLEL_MIN_SIZE", 32 * 1024 * 1024))  # smaller files use one request
+    DOWNLOAD_POOL_SIZE: int = int(os.getenv("DOWNLOAD_POOL_SIZE", 32))  # connections shared by all downloads
+    DOWNLOAD_RETRIES: int = int(os.getenv("DOWNLOAD_RETRIES", 5))
+    PROGRESS_EDIT_INTERVAL: float = float(os.getenv("PROGRESS_EDIT_INTERVAL", 3))  # min seconds between edits of one message
+    PROGRESS_MIN_DURATION: float = float(os.getenv("PROGRESS_MIN_DURATION", 120))  # videos shorter than this encode without a progress bar
+    
+    # Write-behind Settings
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 100))
+    WRITE_BEHIND_INTERVAL: float = float(os.getenv("WRITE_BEHIND_INTERVAL", 2))  # seconds
+    WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 10000))
+    
+    # Cache Settings
+    SETTINGS_CACHE_SIZE: int = int(os.getenv("SETTINGS_CACHE_SIZE", 10000))
+    SETTINGS_CACHE_TTL: int = int(os.getenv("SETTINGS_CACHE_TTL", 300))  # seconds
+    SETTINGS_POLL_INTERVAL: float = float(os.getenv("SETTINGS_POLL_INTERVAL", 5))  # fallback when change streams are unavailable
+    
+    # Telegram Rate Limits
+    RATE_LIMIT_GLOBAL: float = float(os.getenv("RATE_LIMIT_GLOBAL", 30))  # messages per second, all chats
+    RATE_LIMIT_PER_CHAT: float = float(os.getenv("RATE_LIMIT_PER_CHAT", 1))  # messages per second, private chats
+    RATE_LIMIT_PER_GROUP: float = float(os.getenv("RATE_LIMIT_PER_GROUP", 20))  # messages per minute, groups
+    RATE_LIMIT_CHAT_BURST: int = int(os.getenv("RATE_LIMIT_CHAT_BURST", 3))
+    RATE_LIMIT_MAX_RETRIES: int = int(os.getenv("RATE_LIMIT_MAX_RETRIES", 3))
+    
+    # Worker Settings
+    USE_JOB_WORKER: bool = os.getenv("USE_JOB_WORKER", "false").lower() == "true"
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", 60))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    WORKER_POLL_INTERVAL: float = float(os.getenv("WORKER_POLL_INTERVAL", 2))
+    ADMISSION_POLL_INTERVAL: float = float(os.getenv("ADMISSION_POLL_INTERVAL", 5))  # fallback when change streams are unavailable
     
     # FFmpeg Settings
     FFMPEG_PATH: str = os.getenv("FFMPEG_PATH", "ffmpeg")
     FFPROBE_PATH: str = os.getenv("FFPROBE_PATH", "ffprobe")
+    FFMPEG_STDERR_LINES: int = int(os.getenv("FFMPEG_STDERR_LINES", 50))  # kept for error reports
+    MEDIA_INFO_CACHE_SIZE: int = int(os.getenv("MEDIA_INFO_CACHE_SIZE", 1024))
+    PARALLEL_SEGMENTS: int = int(os.getenv("PARALLEL_SEGMENTS", os.cpu_count() or 1))
+    PARALLEL_MIN_DURATION: int = int(os.getenv("PARALLEL_MIN_DURATION", 120))  # seconds; shorter clips encode in one process
+    STREAMING_PIPELINE: bool = os.getenv("STREAMING_PIPELINE", "true").lower() == "true"
+    STREAM_UPLOAD_READ_TIMEOUT: float = float(os.getenv("STREAM_UPLOAD_READ_TIMEOUT", 600))  # seconds a Bot API server may take to answer an upload
+    PROBE_HEADER_SIZE: int = int(os.getenv("PROBE_HEADER_SIZE", 5 * 1024 * 1024))  # 5MB
     
     # Audio Settings Defaults
     DEFAULT_AUDIO_BITRATE: str = "192k"
@@ -57,5 +121,9 @@ class Config:
     WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
     PORT: int = int(os.getenv("PORT", 8080))
     HOST: str = os.getenv("HOST", "0.0.0.0")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")  # checked against X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))  # updates accepted but not yet handled
+    UPDATE_CONCURRENCY: int = int(os.getenv("UPDATE_CONCURRENCY", 256))  # updates handled at once
+    WEBHOOK_DEDUP_WINDOW: int = int(os.getenv("WEBHOOK_DEDUP_WINDOW", 10000))  # recent update_ids remembered
 
 config = Config()
@@ -1,4 +1,5 @@
 import motor.motor_asyncio
+from pymongo.errors import OperationFailure
 from config import config
 
 class MongoDB:
@@ -42,11 +43,33 @@ async def init_db():
     # Create collections with indexes
     await db.users.create_index("user_id", unique=True)
     await db.settings.create_index("user_id", unique=True)
+    await db.settings.create_index("updated_at")
     await db.history.create_index([("user_id", 1), ("timestamp", -1)])
+    await ensure_ttl_index(db.history, "timestamp", config.HISTORY_RETENTION_DAYS * 86400)
+    await db.usage_daily.create_index([("user_id", 1), ("day", 1), ("action", 1)], unique=True)
     await db.jobs.create_index([("user_id", 1), ("status", 1)])
+    await db.jobs.create_index("job_id", unique=True)
+    await db.jobs.create_index([("status", 1), ("start_time", 1)])
+    await db.jobs.create_index([("status", 1), ("lease_until", 1)])
+    await db.jobs.create_index("start_time")
+    await db.jobs.create_index("end_time")
+    await db.results.create_index("key", unique=True)
+    await db.results.create_index("file_unique_id")
+    await db.media_info.create_index("key", unique=True)
+    await db.keyframes.create_index("key", unique=True)
     
     print("Database initialized with indexes")
 
+async def ensure_ttl_index(collection, field: str, seconds: int):
+    """Create a TTL index, or update its expiry if it exists with another one"""
+    try:
+        await collection.create_index(field, expireAfterSeconds=seconds)
+    except OperationFailure:
+        await collection.database.command(
+            "collMod", collection.name,
+            index={"keyPattern": {field: 1}, "expireAfterSeconds": seconds}
+        )
+
 async def get_database():
     """Get database instance"""
     return await mongodb.get_db()
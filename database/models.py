@@ -42,9 +42,15 @@ class ProcessingJob(BaseModel):
     file_type: str
     action: str
     status: str  # pending, processing, completed, failed
+    chat_id: Optional[int] = None
+    params: Dict[str, Any] = Field(default_factory=dict)
     input_path: Optional[str] = None
     output_path: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    worker_id: Optional[str] = None
+    lease_until: Optional[datetime] = None
+    attempts: int = 0
     start_time: datetime = Field(default_factory=datetime.utcnow)
     end_time: Optional[datetime] = None
 
@@ -57,6 +63,19 @@ class UserHistory(BaseModel):
     status: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class UsageRollup(BaseModel):
+    """Daily totals for one user (or ALL_USERS) and one action"""
+    day: str  # YYYY-MM-DD, UTC
+    user_id: int
+    action: str
+    count: int = 0
+    bytes: int = 0
+    processing_seconds: float = 0.0
+    failures: int = 0
+
+# user_id of the rollups that total every user
+ALL_USERS = 0
+
 class BulkOperation(BaseModel):
     operation_id: str
     user_id: int
@@ -65,3 +84,72 @@ class BulkOperation(BaseModel):
     status: str
     results: List[Dict[str, Any]]
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class MediaStream(BaseModel):
+    index: int
+    codec_type: str
+    codec_name: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: float = 0.0
+    pix_fmt: Optional[str] = None
+    channels: Optional[int] = None
+    sample_rate: Optional[int] = None
+    bit_rate: Optional[int] = None
+
+class MediaInfo(BaseModel):
+    key: str
+    format_name: str = ""
+    duration: float = 0.0
+    size: int = 0
+    bit_rate: int = 0
+    streams: List[MediaStream] = Field(default_factory=list)
+    probed_at: datetime = Field(default_factory=datetime.utcnow)
+
+    @property
+    def video(self) -> Optional[MediaStream]:
+        return next((s for s in self.streams if s.codec_type == "video"), None)
+
+    @property
+    def audio(self) -> Optional[MediaStream]:
+        return next((s for s in self.streams if s.codec_type == "audio"), None)
+
+    @classmethod
+    def from_ffprobe(cls, key: str, data: Dict[str, Any]) -> "MediaInfo":
+        """Parse `ffprobe -show_format -show_streams` JSON"""
+        def number(value, cast=int):
+            try:
+                return cast(value)
+            except (TypeError, ValueError):
+                return None
+
+        def rate(value: str) -> float:
+            num, _, den = (value or "0").partition("/")
+            try:
+                return float(num) / float(den or 1)
+            except (ValueError, ZeroDivisionError):
+                return 0.0
+
+        fmt = data.get("format", {})
+        return cls(
+            key=key,
+            format_name=fmt.get("format_name", ""),
+            duration=number(fmt.get("duration"), float) or 0.0,
+            size=number(fmt.get("size")) or 0,
+            bit_rate=number(fmt.get("bit_rate")) or 0,
+            streams=[
+                MediaStream(
+                    index=s.get("index", i),
+                    codec_type=s.get("codec_type", "unknown"),
+                    codec_name=s.get("codec_name"),
+                    width=s.get("width"),
+                    height=s.get("height"),
+                    fps=rate(s.get("avg_frame_rate")),
+                    pix_fmt=s.get("pix_fmt"),
+                    channels=s.get("channels"),
+                    sample_rate=number(s.get("sample_rate")),
+                    bit_rate=number(s.get("bit_rate"))
+                )
+                for i, s in enumerate(data.get("streams", []))
+            ]
+        )
@@ -0,0 +1,237 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
+from database.connection import get_database, init_db, mongodb
+from database.storage import ChangeFeedUnavailable, Storage
+
+class MongoStorage(Storage):
+    """MongoDB through the shared Motor client"""
+
+    async def initialize(self):
+        await init_db()
+
+    async def close(self):
+        await mongodb.disconnect()
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        db = await get_database()
+        return await db.users.find_one({"user_id": user_id})
+
+    async def insert_user(self, user: Dict[str, Any]):
+        db = await get_database()
+        await db.users.insert_one(dict(user))
+
+    async def update_user(self, user_id: int, fields: Dict[str, Any]):
+        db = await get_database()
+        await db.users.update_one({"user_id": user_id}, {"$set": fields})
+
+    async def update_user_stats(self, updates: Dict[int, Dict[str, Dict[str, Any]]]):
+        db = await get_database()
+        await db.users.bulk_write(
+            [UpdateOne({"user_id": user_id}, update) for user_id, update in updates.items()],
+            ordered=False
+        )
+
+    async def get_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
+        db = await get_database()
+        return await db.settings.find_one({"user_id": user_id})
+
+    async def save_settings(self, settings: Dict[str, Any]):
+        db = await get_database()
+        await db.settings.update_one(
+            {"user_id": settings["user_id"]},
+            {"$set": settings},
+            upsert=True
+        )
+
+    async def update_settings(self, user_id: int, fields: Dict[str, Any]) -> Dict[str, Any]:
+        db = await get_database()
+        return await db.settings.find_one_and_update(
+            {"user_id": user_id},
+            {"$set": fields},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def settings_changed_since(self, since: datetime) -> List[Dict[str, Any]]:
+        db = await get_database()
+        return await db.settings.find({"updated_at": {"$gt": since}}).to_list(length=None)
+
+    async def insert_job(self, job: Dict[str, Any]):
+        db = await get_database()
+        await db.jobs.insert_one(dict(job))
+
+    async def update_jobs(self, updates: Dict[str, Dict[str, Any]]):
+        db = await get_database()
+        await db.jobs.bulk_write(
+            [UpdateOne({"job_id": job_id}, {"$set": fields}) for job_id, fields in updates.items()],
+            ordered=False
+        )
+
+    async def claim_job(self, worker_id: str, lease_until: datetime) -> Optional[Dict[str, Any]]:
+        db = await get_database()
+        return await db.jobs.find_one_and_update(
+            {"status": "pending"},
+            {
+                "$set": {
+                    "status": "processing",
+                    "worker_id": worker_id,
+                    "lease_until": lease_until
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("start_time", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def heartbeat_job(self, job_id: str, worker_id: str, lease_until: datetime) -> bool:
+        db = await get_database()
+        result = await db.jobs.update_one(
+            {"job_id": job_id, "worker_id": worker_id, "status": "processing"},
+            {"$set": {"lease_until": lease_until}}
+        )
+        return result.modified_count == 1
+
+    async def finish_job(self, job_id: str, worker_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        db = await get_database()
+        return await db.jobs.find_one_and_update(
+            {"job_id": job_id, "worker_id": worker_id, "status": "processing"},
+            {"$set": fields},
+            projection={"user_id": 1}
+        )
+
+    async def release_job(self, job_id: str, worker_id: str):
+        db = await get_database()
+        await db.jobs.update_one(
+            {"job_id": job_id, "worker_id": worker_id, "status": "processing"},
+            {
+                "$set": {"status": "pending", "worker_id": None, "lease_until": None},
+                "$inc": {"attempts": -1}
+            }
+        )
+
+    async def requeue_expired_jobs(self, max_attempts: int) -> int:
+        db = await get_database()
+        now = datetime.utcnow()
+        expired = {"status": "processing", "lease_until": {"$lt": now}}
+
+        await db.jobs.update_many(
+            {**expired, "attempts": {"$gte": max_attempts}},
+            {"$set": {"status": "failed", "error": "Lease expired too many times",
+                      "worker_id": None, "lease_until": None, "end_time": now}}
+        )
+        result = await db.jobs.update_many(
+            expired,
+            {"$set": {"status": "pending", "worker_id": None, "lease_until": None}}
+        )
+        return result.modified_count
+
+    async def active_jobs(self) -> List[Dict[str, Any]]:
+        db = await get_database()
+        cursor = db.jobs.find({"status": {"$in": ["pending", "processing"]}}, {"user_id": 1, "job_id": 1})
+        return await cursor.to_list(length=None)
+
+    async def last_completions(self, since: datetime) -> Dict[int, datetime]:
+        db = await get_database()
+        cursor = db.jobs.aggregate([
+            {"$match": {"status": "completed", "end_time": {"$gt": since}}},
+            {"$group": {"_id": "$user_id", "end_time": {"$max": "$end_time"}}}
+        ])
+        return {row["_id"]: row["end_time"] async for row in cursor}
+
+    async def jobs_changed_since(self, since: datetime) -> List[Dict[str, Any]]:
+        db = await get_database()
+        cursor = db.jobs.find(
+            {"$or": [{"start_time": {"$gt": since}}, {"end_time": {"$gt": since}}]},
+            {"user_id": 1, "job_id": 1, "status": 1, "end_time": 1}
+        )
+        return await cursor.to_list(length=None)
+
+    async def insert_history(self, entries: List[Dict[str, Any]]):
+        db = await get_database()
+        await db.history.insert_many([dict(entry) for entry in entries], ordered=False)
+
+    async def get_user_history(self, user_id: int, limit: int) -> List[Dict[str, Any]]:
+        db = await get_database()
+        cursor = db.history.find({"user_id": user_id}).sort("timestamp", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def increment_rollups(self, increments: Dict[Tuple[str, int, str], Dict[str, Any]]):
+        db = await get_database()
+        await db.usage_daily.bulk_write(
+            [
+                UpdateOne({"day": day, "user_id": user_id, "action": action}, {"$inc": inc}, upsert=True)
+                for (day, user_id, action), inc in increments.items()
+            ],
+            ordered=False
+        )
+
+    async def get_rollups(self, user_id: int, since_day: str) -> List[Dict[str, Any]]:
+        db = await get_database()
+        cursor = db.usage_daily.find({"user_id": user_id, "day": {"$gte": since_day}}, {"_id": 0})
+        return await cursor.to_list(length=None)
+
+    async def get_cached_result(self, key: str) -> Optional[Dict[str, Any]]:
+        db = await get_database()
+        return await db.results.find_one_and_update(
+            {"key": key},
+            {"$inc": {"hits": 1}, "$set": {"last_used": datetime.utcnow()}}
+        )
+
+    async def cache_result(self, key: str, fields: Dict[str, Any]):
+        db = await get_database()
+        await db.results.update_one(
+            {"key": key},
+            {
+                "$set": {**fields, "last_used": datetime.utcnow()},
+                "$setOnInsert": {"created_at": datetime.utcnow(), "hits": 0}
+            },
+            upsert=True
+        )
+
+    async def delete_cached_result(self, key: str):
+        db = await get_database()
+        await db.results.delete_one({"key": key})
+
+    async def get_media_info(self, key: str) -> Optional[Dict[str, Any]]:
+        db = await get_database()
+        # Entries written before keyframes moved to their own collection
+        # may hold only a keyframe list; those are not probe results
+        return await db.media_info.find_one(
+            {"key": key, "format_name": {"$exists": True}}, {"_id": 0, "keyframes": 0}
+        )
+
+    async def save_media_info(self, info: Dict[str, Any]):
+        db = await get_database()
+        await db.media_info.update_one(
+            {"key": info["key"]},
+            {"$set": info},
+            upsert=True
+        )
+
+    async def get_keyframes(self, key: str) -> Optional[List[float]]:
+        db = await get_database()
+        data = await db.keyframes.find_one({"key": key}, {"keyframes": 1})
+        return data["keyframes"] if data else None
+
+    async def save_keyframes(self, key: str, keyframes: List[float]):
+        db = await get_database()
+        await db.keyframes.update_one(
+            {"key": key},
+            {"$set": {"keyframes": keyframes}},
+            upsert=True
+        )
+
+    async def watch(self, collection: str) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        db = await get_database()
+        try:
+            async with db[collection].watch(full_document="updateLookup") as stream:
+                async for change in stream:
+                    if change["operationType"] in ("insert", "update", "replace"):
+                        yield change.get("fullDocument")
+                    else:
+                        yield None
+        except OperationFailure as e:
+            # Standalone servers have no oplog to stream from
+            raise ChangeFeedUnavailable(str(e)) from e
@@ -1,32 +1,35 @@
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
-from bson import ObjectId
-from database.connection import get_database
-from database.models import UserSettings, ProcessingJob, UserHistory, BulkOperation
+from config import config
+from database.storage import get_storage
+from database.models import UserSettings, ProcessingJob, UserHistory, UsageRollup, BulkOperation, ALL_USERS
+from database.settings_cache import settings_cache
+from database.write_behind import write_behind
+from utils.admission import admission
 
 class DatabaseOperations:
     @staticmethod
     async def get_user(user_id: int) -> Optional[Dict[str, Any]]:
-        db = await get_database()
-        return await db.users.find_one({"user_id": user_id})
+        storage = await get_storage()
+        return await storage.get_user(user_id)
     
     @staticmethod
     async def create_user(user_id: int, username: str = None, first_name: str = None) -> Dict[str, Any]:
-        db = await get_database()
+        storage = await get_storage()
         
         user_data = {
             "user_id": user_id,
             "username": username,
             "first_name": first_name,
-            "tier": "premium" if user_id in [123456789] else "free",  # Default premium IDs
+            "tier": "premium" if user_id in config.PREMIUM_USER_IDS else "free",
             "joined": datetime.utcnow(),
             "last_active": datetime.utcnow(),
             "total_files": 0,
             "total_size": 0
         }
         
-        result = await db.users.insert_one(user_data)
-        user_data["_id"] = result.inserted_id
+        await storage.insert_user(user_data)
         
         # Initialize settings
         await DatabaseOperations.init_user_settings(user_id)
@@ -34,65 +37,160 @@ class DatabaseOperations:
         return user_data
     
     @staticmethod
-    async def init_user_settings(user_id: int):
-        db = await get_database()
+    async def set_user_tier(user_id: int, tier: str):
+        from utils.premium import invalidate_tier
+        
+        storage = await get_storage()
+        await storage.update_user(user_id, {"tier": tier})
+        invalidate_tier(user_id)
+    
+    @staticmethod
+    async def init_user_settings(user_id: int) -> UserSettings:
+        storage = await get_storage()
         settings = UserSettings(user_id=user_id)
-        await db.settings.update_one(
-            {"user_id": user_id},
-            {"$set": settings.dict()},
-            upsert=True
-        )
+        await storage.save_settings(settings.dict())
+        settings_cache.put(settings)
+        return settings
     
     @staticmethod
     async def get_user_settings(user_id: int) -> Optional[UserSettings]:
-        db = await get_database()
-        data = await db.settings.find_one({"user_id": user_id})
+        settings = settings_cache.get(user_id)
+        if settings:
+            return settings
+        
+        version = settings_cache.version(user_id)
+        storage = await get_storage()
+        data = await storage.get_settings(user_id)
         if data:
-            return UserSettings(**data)
+            settings = UserSettings(**data)
+            settings_cache.put(settings, version)
+            return settings
         return None
     
     @staticmethod
-    async def update_settings(user_id: int, **kwargs):
-        db = await get_database()
+    async def update_settings(user_id: int, **kwargs) -> UserSettings:
+        storage = await get_storage()
         kwargs["updated_at"] = datetime.utcnow()
-        await db.settings.update_one(
-            {"user_id": user_id},
-            {"$set": kwargs},
-            upsert=True
-        )
+        data = await storage.update_settings(user_id, kwargs)
+        # Write-through: the updated document replaces the cached copy
+        settings = UserSettings(**data)
+        settings_cache.put(settings)
+        return settings
     
     @staticmethod
     async def reset_settings(user_id: int):
         await DatabaseOperations.init_user_settings(user_id)
     
     @staticmethod
-    async def create_job(user_id: int, file_id: str, file_type: str, action: str) -> str:
-        db = await get_database()
+    async def create_job(user_id: int, file_id: str, file_type: str, action: str,
+                         chat_id: int = None, params: Dict[str, Any] = None) -> str:
+        storage = await get_storage()
         job = ProcessingJob(
-            job_id=str(ObjectId()),
+            job_id=uuid.uuid4().hex,
             user_id=user_id,
             file_id=file_id,
             file_type=file_type,
             action=action,
-            status="pending"
+            status="pending",
+            chat_id=chat_id,
+            params=params or {}
         )
-        result = await db.jobs.insert_one(job.dict())
-        return str(result.inserted_id)
+        await storage.insert_job(job.dict())
+        admission.job_started(user_id, job.job_id)
+        return job.job_id
     
     @staticmethod
     async def update_job(job_id: str, **kwargs):
-        db = await get_database()
+        """Buffered; the write lands with the next write-behind flush"""
         if "status" in kwargs and kwargs["status"] == "completed":
             kwargs["end_time"] = datetime.utcnow()
-        await db.jobs.update_one(
-            {"job_id": job_id},
-            {"$set": kwargs}
-        )
+        write_behind.update_job(job_id, kwargs)
+        if "status" in kwargs:
+            admission.job_updated(job_id, kwargs["status"], kwargs.get("end_time"))
+    
+    @staticmethod
+    async def claim_job(worker_id: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest pending job and lease it to a worker"""
+        storage = await get_storage()
+        return await storage.claim_job(worker_id, datetime.utcnow() + timedelta(seconds=lease_seconds))
+    
+    @staticmethod
+    async def heartbeat_job(job_id: str, worker_id: str, lease_seconds: int) -> bool:
+        """Extend a lease; False means the worker no longer owns the job"""
+        storage = await get_storage()
+        return await storage.heartbeat_job(job_id, worker_id, datetime.utcnow() + timedelta(seconds=lease_seconds))
+    
+    @staticmethod
+    async def finish_job(job_id: str, worker_id: str, status: str, **kwargs) -> bool:
+        """Record a job outcome if the worker still holds its lease"""
+        storage = await get_storage()
+        kwargs["status"] = status
+        kwargs["lease_until"] = None
+        if status in ("completed", "failed"):
+            kwargs["end_time"] = datetime.utcnow()
+        job = await storage.finish_job(job_id, worker_id, kwargs)
+        if job is None:
+            return False
+        admission.job_finished(job["user_id"], job_id, status, kwargs.get("end_time"))
+        return True
+    
+    @staticmethod
+    async def release_job(job_id: str, worker_id: str):
+        """Hand a leased job back to the queue, e.g. on worker shutdown"""
+        storage = await get_storage()
+        await storage.release_job(job_id, worker_id)
+    
+    @staticmethod
+    async def requeue_expired_jobs(max_attempts: int) -> int:
+        """Return jobs whose lease expired to the queue, failing ones that keep crashing"""
+        storage = await get_storage()
+        return await storage.requeue_expired_jobs(max_attempts)
+    
+    @staticmethod
+    async def get_cached_result(key: str) -> Optional[Dict[str, Any]]:
+        storage = await get_storage()
+        return await storage.get_cached_result(key)
+    
+    @staticmethod
+    async def cache_result(key: str, file_unique_id: str, operation: str,
+                           media_type: str, file_id: str):
+        storage = await get_storage()
+        await storage.cache_result(key, {
+            "file_unique_id": file_unique_id,
+            "operation": operation,
+            "media_type": media_type,
+            "file_id": file_id
+        })
+    
+    @staticmethod
+    async def delete_cached_result(key: str):
+        storage = await get_storage()
+        await storage.delete_cached_result(key)
+    
+    @staticmethod
+    async def get_media_info(key: str) -> Optional[Dict[str, Any]]:
+        storage = await get_storage()
+        return await storage.get_media_info(key)
+    
+    @staticmethod
+    async def save_media_info(info: Dict[str, Any]):
+        storage = await get_storage()
+        await storage.save_media_info(info)
+    
+    @staticmethod
+    async def get_keyframes(key: str) -> Optional[List[float]]:
+        storage = await get_storage()
+        return await storage.get_keyframes(key)
+    
+    @staticmethod
+    async def save_keyframes(key: str, keyframes: List[float]):
+        storage = await get_storage()
+        await storage.save_keyframes(key, keyframes)
     
     @staticmethod
     async def add_history(user_id: int, action: str, file_type: str, 
                          file_size: int, status: str, processing_time: float):
-        db = await get_database()
+        """Buffered; history and user stats are written in batches"""
         history = UserHistory(
             user_id=user_id,
             action=action,
@@ -101,55 +199,67 @@ class DatabaseOperations:
             processing_time=processing_time,
             status=status
         )
-        await db.history.insert_one(history.dict())
+        write_behind.add_history(history.dict())
         
         # Update user stats
-        await db.users.update_one(
-            {"user_id": user_id},
-            {
-                "$inc": {"total_files": 1, "total_size": file_size},
-                "$set": {"last_active": datetime.utcnow()}
-            }
+        write_behind.update_user(
+            user_id,
+            {"total_files": 1, "total_size": file_size},
+            {"last_active": datetime.utcnow()}
         )
+        
+        # Daily rollups, per user and across all users
+        day = history.timestamp.strftime("%Y-%m-%d")
+        counters = {
+            "count": 1,
+            "bytes": file_size,
+            "processing_seconds": processing_time,
+            "failures": 0 if status == "completed" else 1
+        }
+        write_behind.update_rollup(day, user_id, action, counters)
+        write_behind.update_rollup(day, ALL_USERS, action, counters)
     
     @staticmethod
     async def get_user_history(user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
-        db = await get_database()
-        cursor = db.history.find({"user_id": user_id}).sort("timestamp", -1).limit(limit)
-        return await cursor.to_list(length=limit)
+        storage = await get_storage()
+        return await storage.get_user_history(user_id, limit)
+    
+    @staticmethod
+    async def get_usage(user_id: int, days: int = 30) -> Dict[str, UsageRollup]:
+        """Per-action totals over the last `days` days, summed from daily rollups"""
+        storage = await get_storage()
+        since_day = (datetime.utcnow() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        
+        totals: Dict[str, UsageRollup] = {}
+        for row in await storage.get_rollups(user_id, since_day):
+            total = totals.setdefault(row["action"], UsageRollup(day=since_day, user_id=user_id, action=row["action"]))
+            total.count += row.get("count", 0)
+            total.bytes += row.get("bytes", 0)
+            total.processing_seconds += row.get("processing_seconds", 0.0)
+            total.failures += row.get("failures", 0)
+        return totals
     
     @staticmethod
     async def can_process(user_id: int, file_size: int) -> tuple[bool, str]:
-        from config import config
         from utils.premium import is_premium_user
         
+        premium = await is_premium_user(user_id)
+        
         # Check file size
-        max_size = config.MAX_FILE_SIZE_PREMIUM if await is_premium_user(user_id) else config.MAX_FILE_SIZE_FREE
+        max_size = config.MAX_FILE_SIZE_PREMIUM if premium else config.MAX_FILE_SIZE_FREE
         if file_size > max_size:
             return False, f"File too large. Max: {max_size // (1024*1024)}MB"
         
         # Check concurrent jobs
-        db = await get_database()
-        active_jobs = await db.jobs.count_documents({
-            "user_id": user_id,
-            "status": {"$in": ["pending", "processing"]}
-        })
-        
-        if active_jobs >= config.MAX_CONCURRENT_JOBS:
+        if admission.active_jobs(user_id) >= config.MAX_CONCURRENT_JOBS:
             return False, "Too many active jobs"
         
         # Check wait time for free users
-        if not await is_premium_user(user_id):
-            last_job = await db.jobs.find_one(
-                {"user_id": user_id, "status": "completed"},
-                sort=[("end_time", -1)]
-            )
-            
-            if last_job and last_job.get("end_time"):
-                wait_left = (last_job["end_time"] + timedelta(seconds=config.FREE_USER_WAIT_TIME)) - datetime.utcnow()
-                if wait_left.total_seconds() > 0:
-                    minutes = int(wait_left.total_seconds() // 60)
-                    seconds = int(wait_left.total_seconds() % 60)
-                    return False, f"Wait {minutes}m {seconds}s before next file"
+        if not premium:
+            wait_left = admission.wait_left(user_id)
+            if wait_left > 0:
+                minutes = int(wait_left // 60)
+                seconds = int(wait_left % 60)
+                return False, f"Wait {minutes}m {seconds}s before next file"
         
         return True, ""
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from config import config
+from database.models import UserSettings
+from database.storage import ChangeFeedUnavailable, get_storage
+
+logger = logging.getLogger(__name__)
+
+class SettingsCache:
+    """TTL + LRU cache of UserSettings shared by all handlers in a process.
+
+    DatabaseOperations writes through it, so a process always sees its own
+    updates. Other replicas' writes arrive through the storage change feed
+    (a Mongo change stream); backends or deployments without one poll for
+    recently updated documents instead. The TTL bounds staleness if either
+    feed misses something.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or config.SETTINGS_CACHE_SIZE
+        self.ttl = ttl or config.SETTINGS_CACHE_TTL
+        self._entries: "OrderedDict[int, tuple[UserSettings, float]]" = OrderedDict()
+        # Bumped on every write/invalidation so a slow read can't cache stale data
+        self._versions: Dict[int, int] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[UserSettings]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[0]
+
+    def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def put(self, settings: UserSettings, version: Optional[int] = None):
+        """Cache settings; with `version`, only if nothing changed since it was taken"""
+        if version is not None and version != self.version(settings.user_id):
+            return
+        self._bump(settings.user_id)
+        self._entries[settings.user_id] = (settings, time.monotonic() + self.ttl)
+        self._entries.move_to_end(settings.user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Drop one user's settings, or everything"""
+        if user_id is None:
+            self._entries.clear()
+            self._versions.clear()
+            return
+        self._bump(user_id)
+        self._entries.pop(user_id, None)
+
+    def _bump(self, user_id: int):
+        self._versions[user_id] = self.version(user_id) + 1
+        if len(self._versions) > self.max_entries * 2:
+            # Versions only matter while a read is in flight
+            self._versions = {uid: v for uid, v in self._versions.items() if uid in self._entries}
+
+    def _apply(self, document: Optional[Dict[str, Any]], user_id: Optional[int] = None):
+        """Refresh a cached user from a changed document; others' writes only bump the version"""
+        if document and document["user_id"] in self._entries:
+            self.put(UserSettings(**document))
+        else:
+            self.invalidate(document["user_id"] if document else user_id)
+
+    def start(self):
+        """Begin following writes made by other instances"""
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self):
+        storage = await get_storage()
+        while True:
+            try:
+                logger.info("Settings cache following change feed")
+                async for document in storage.watch("settings"):
+                    if document:
+                        self._apply(document)
+                    else:
+                        # Deletes only carry _id, and drops affect everyone
+                        self.invalidate()
+            except ChangeFeedUnavailable as e:
+                logger.info(f"Change feed unavailable ({e}), polling settings instead")
+                await self._poll()
+                return
+            except Exception as e:
+                logger.warning(f"Settings change feed interrupted: {e}")
+                self.invalidate()
+                await asyncio.sleep(config.SETTINGS_POLL_INTERVAL)
+
+    async def _poll(self):
+        storage = await get_storage()
+        # Overlap windows a little so writes racing the previous poll aren't missed
+        since = datetime.utcnow()
+        overlap = timedelta(seconds=config.SETTINGS_POLL_INTERVAL)
+        while True:
+            await asyncio.sleep(config.SETTINGS_POLL_INTERVAL)
+            try:
+                now = datetime.utcnow()
+                for document in await storage.settings_changed_since(since - overlap):
+                    self._apply(document)
+                since = now
+            except Exception as e:
+                logger.warning(f"Settings poll failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0
+        }
+
+# Singleton instance
+settings_cache = SettingsCache()
@@ -0,0 +1,416 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config import config
+from database.storage import Storage
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    user_id INTEGER PRIMARY KEY,
+    updated_at TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS settings_updated_at ON settings (updated_at);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    worker_id TEXT,
+    lease_until TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    start_time TEXT,
+    end_time TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_start ON jobs (status, start_time);
+CREATE INDEX IF NOT EXISTS jobs_status_lease ON jobs (status, lease_until);
+CREATE INDEX IF NOT EXISTS jobs_user_status ON jobs (user_id, status);
+CREATE INDEX IF NOT EXISTS jobs_start_time ON jobs (start_time);
+CREATE INDEX IF NOT EXISTS jobs_end_time ON jobs (end_time);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_user_timestamp ON history (user_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    processing_seconds REAL NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, action)
+);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    file_unique_id TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_file_unique_id ON results (file_unique_id);
+CREATE TABLE IF NOT EXISTS media_info (
+    key TEXT PRIMARY KEY,
+    doc TEXT,
+    keyframes TEXT
+);
+"""
+
+ROLLUP_COUNTERS = ("count", "bytes", "processing_seconds", "failures")
+
+# Columns mirrored out of the jobs document so they can be indexed and filtered
+JOB_COLUMNS = ("user_id", "status", "worker_id", "lease_until", "attempts", "start_time", "end_time")
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.strftime(DATE_FORMAT)}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.strptime(obj["$date"], DATE_FORMAT)
+    return obj
+
+def _dumps(doc: Dict[str, Any]) -> str:
+    return json.dumps(doc, default=_encode)
+
+def _loads(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    return json.loads(text, object_hook=_decode) if text else None
+
+def _column(value: Any) -> Any:
+    """Datetimes as fixed-width strings so they sort and compare correctly"""
+    return value.strftime(DATE_FORMAT) if isinstance(value, datetime) else value
+
+class SQLiteStorage(Storage):
+    """Embedded single-file storage for single-node installs and tests.
+
+    Documents are stored as JSON with the fields that are queried mirrored
+    into indexed columns. The database runs in WAL mode so the bot and
+    worker.py on the same host can share it. All access goes through one
+    connection on one dedicated thread, which keeps sqlite3 off the event
+    loop without needing locks.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._history_purged: Optional[float] = None
+
+    async def _run(self, func: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run func inside BEGIN IMMEDIATE ... COMMIT so read-modify-writes are atomic"""
+        def run():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+            return result
+        return await self._run(run)
+
+    async def initialize(self):
+        def connect():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            return conn
+        self._conn = await self._run(connect)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    async def _fetch_doc(self, sql: str, params: tuple) -> Optional[Dict[str, Any]]:
+        def fetch():
+            row = self._conn.execute(sql, params).fetchone()
+            return _loads(row[0]) if row else None
+        return await self._run(fetch)
+
+    async def _fetch_docs(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        def fetch():
+            return [_loads(row[0]) for row in self._conn.execute(sql, params)]
+        return await self._run(fetch)
+
+    # Users
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self._fetch_doc("SELECT doc FROM users WHERE user_id = ?", (user_id,))
+
+    async def insert_user(self, user: Dict[str, Any]):
+        await self._run(
+            self._conn.execute,
+            "INSERT INTO users (user_id, doc) VALUES (?, ?)",
+            (user["user_id"], _dumps(user))
+        )
+
+    async def update_user(self, user_id: int, fields: Dict[str, Any]):
+        def update(conn):
+            row = conn.execute("SELECT doc FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if row:
+                conn.execute("UPDATE users SET doc = ? WHERE user_id = ?",
+                             (_dumps({**_loads(row[0]), **fields}), user_id))
+        await self._transaction(update)
+
+    async def update_user_stats(self, updates: Dict[int, Dict[str, Dict[str, Any]]]):
+        def update(conn):
+            for user_id, change in updates.items():
+                row = conn.execute("SELECT doc FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                if not row:
+                    continue
+                doc = _loads(row[0])
+                for name, value in change.get("$inc", {}).items():
+                    doc[name] = doc.get(name, 0) + value
+                doc.update(change.get("$set", {}))
+                conn.execute("UPDATE users SET doc = ? WHERE user_id = ?", (_dumps(doc), user_id))
+        await self._transaction(update)
+
+    # Settings
+
+    async def get_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self._fetch_doc("SELECT doc FROM settings WHERE user_id = ?", (user_id,))
+
+    async def save_settings(self, settings: Dict[str, Any]):
+        await self._run(
+            self._conn.execute,
+            "INSERT OR REPLACE INTO settings (user_id, updated_at, doc) VALUES (?, ?, ?)",
+            (settings["user_id"], _column(settings.get("updated_at")), _dumps(settings))
+        )
+
+    async def update_settings(self, user_id: int, fields: Dict[str, Any]) -> Dict[str, Any]:
+        def update(conn):
+            row = conn.execute("SELECT doc FROM settings WHERE user_id = ?", (user_id,)).fetchone()
+            doc = {**(_loads(row[0]) if row else {"user_id": user_id}), **fields}
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (user_id, updated_at, doc) VALUES (?, ?, ?)",
+                (user_id, _column(doc.get("updated_at")), _dumps(doc))
+            )
+            return doc
+        return await self._transaction(update)
+
+    async def settings_changed_since(self, since: datetime) -> List[Dict[str, Any]]:
+        return await self._fetch_docs("SELECT doc FROM settings WHERE updated_at > ?", (_column(since),))
+
+    # Jobs
+
+    @staticmethod
+    def _write_job(conn: sqlite3.Connection, doc: Dict[str, Any]):
+        conn.execute(
+            f"INSERT OR REPLACE INTO jobs (job_id, {', '.join(JOB_COLUMNS)}, doc) "
+            f"VALUES (?, {', '.join('?' for _ in JOB_COLUMNS)}, ?)",
+            (doc["job_id"], *(_column(doc.get(name)) for name in JOB_COLUMNS), _dumps(doc))
+        )
+
+    @staticmethod
+    def _job(conn: sqlite3.Connection, where: str, params: tuple) -> Optional[Dict[str, Any]]:
+        row = conn.execute(f"SELECT doc FROM jobs WHERE {where}", params).fetchone()
+        return _loads(row[0]) if row else None
+
+    async def insert_job(self, job: Dict[str, Any]):
+        await self._transaction(lambda conn: self._write_job(conn, job))
+
+    async def update_jobs(self, updates: Dict[str, Dict[str, Any]]):
+        def update(conn):
+            for job_id, fields in updates.items():
+                doc = self._job(conn, "job_id = ?", (job_id,))
+                if doc:
+                    self._write_job(conn, {**doc, **fields})
+        await self._transaction(update)
+
+    async def claim_job(self, worker_id: str, lease_until: datetime) -> Optional[Dict[str, Any]]:
+        def claim(conn):
+            doc = self._job(conn, "status = 'pending' ORDER BY start_time LIMIT 1", ())
+            if doc:
+                doc.update(status="processing", worker_id=worker_id, lease_until=lease_until,
+                           attempts=doc.get("attempts", 0) + 1)
+                self._write_job(conn, doc)
+            return doc
+        return await self._transaction(claim)
+
+    async def heartbeat_job(self, job_id: str, worker_id: str, lease_until: datetime) -> bool:
+        return await self.finish_job(job_id, worker_id, {"lease_until": lease_until}) is not None
+
+    async def finish_job(self, job_id: str, worker_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        def finish(conn):
+            doc = self._job(conn, "job_id = ? AND worker_id = ? AND status = 'processing'", (job_id, worker_id))
+            if doc:
+                self._write_job(conn, {**doc, **fields})
+            return doc
+        return await self._transaction(finish)
+
+    async def release_job(self, job_id: str, worker_id: str):
+        def release(conn):
+            doc = self._job(conn, "job_id = ? AND worker_id = ? AND status = 'processing'", (job_id, worker_id))
+            if doc:
+                doc.update(status="pending", worker_id=None, lease_until=None,
+                           attempts=doc.get("attempts", 0) - 1)
+                self._write_job(conn, doc)
+        await self._transaction(release)
+
+    async def requeue_expired_jobs(self, max_attempts: int) -> int:
+        def requeue(conn):
+            now = datetime.utcnow()
+            rows = conn.execute(
+                "SELECT doc FROM jobs WHERE status = 'processing' AND lease_until < ?", (_column(now),)
+            ).fetchall()
+            requeued = 0
+            for row in rows:
+                doc = _loads(row[0])
+                doc.update(worker_id=None, lease_until=None)
+                if doc.get("attempts", 0) >= max_attempts:
+                    doc.update(status="failed", error="Lease expired too many times", end_time=now)
+                else:
+                    doc["status"] = "pending"
+                    requeued += 1
+                self._write_job(conn, doc)
+            return requeued
+        return await self._transaction(requeue)
+
+    async def active_jobs(self) -> List[Dict[str, Any]]:
+        def fetch():
+            rows = self._conn.execute("SELECT user_id, job_id FROM jobs WHERE status IN ('pending', 'processing')")
+            return [{"user_id": user_id, "job_id": job_id} for user_id, job_id in rows]
+        return await self._run(fetch)
+
+    async def last_completions(self, since: datetime) -> Dict[int, datetime]:
+        def fetch():
+            rows = self._conn.execute(
+                "SELECT user_id, MAX(end_time) FROM jobs WHERE status = 'completed' AND end_time > ? GROUP BY user_id",
+                (_column(since),)
+            )
+            return {user_id: datetime.strptime(end_time, DATE_FORMAT) for user_id, end_time in rows}
+        return await self._run(fetch)
+
+    async def jobs_changed_since(self, since: datetime) -> List[Dict[str, Any]]:
+        return await self._fetch_docs(
+            "SELECT doc FROM jobs WHERE start_time > ? OR end_time > ?",
+            (_column(since), _column(since))
+        )
+
+    # History
+
+    async def insert_history(self, entries: List[Dict[str, Any]]):
+        # SQLite has no TTL indexes, so expire old rows here at most hourly
+        purge = self._history_purged is None or time.monotonic() - self._history_purged > 3600
+        if purge:
+            self._history_purged = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(days=config.HISTORY_RETENTION_DAYS)
+
+        def insert(conn):
+            conn.executemany(
+                "INSERT INTO history (user_id, timestamp, doc) VALUES (?, ?, ?)",
+                [(entry["user_id"], _column(entry["timestamp"]), _dumps(entry)) for entry in entries]
+            )
+            if purge:
+                conn.execute("DELETE FROM history WHERE timestamp < ?", (_column(cutoff),))
+        await self._transaction(insert)
+
+    async def get_user_history(self, user_id: int, limit: int) -> List[Dict[str, Any]]:
+        return await self._fetch_docs(
+            "SELECT doc FROM history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?", (user_id, limit)
+        )
+
+    async def increment_rollups(self, increments: Dict[Tuple[str, int, str], Dict[str, Any]]):
+        def increment(conn):
+            conn.executemany(
+                f"INSERT INTO usage_daily (day, user_id, action, {', '.join(ROLLUP_COUNTERS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in ROLLUP_COUNTERS)}) "
+                f"ON CONFLICT (user_id, day, action) DO UPDATE SET "
+                f"{', '.join(f'{name} = {name} + excluded.{name}' for name in ROLLUP_COUNTERS)}",
+                [
+                    (day, user_id, action, *(inc.get(name, 0) for name in ROLLUP_COUNTERS))
+                    for (day, user_id, action), inc in increments.items()
+                ]
+            )
+        await self._transaction(increment)
+
+    async def get_rollups(self, user_id: int, since_day: str) -> List[Dict[str, Any]]:
+        def fetch():
+            self._conn.row_factory = sqlite3.Row
+            try:
+                rows = self._conn.execute(
+                    "SELECT * FROM usage_daily WHERE user_id = ? AND day >= ?", (user_id, since_day)
+                ).fetchall()
+            finally:
+                self._conn.row_factory = None
+            return [dict(row) for row in rows]
+        return await self._run(fetch)
+
+    # Result cache
+
+    async def get_cached_result(self, key: str) -> Optional[Dict[str, Any]]:
+        def fetch(conn):
+            row = conn.execute("SELECT doc FROM results WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            doc = _loads(row[0])
+            # Like find_one_and_update, return the document as it was before the hit
+            updated = {**doc, "hits": doc.get("hits", 0) + 1, "last_used": datetime.utcnow()}
+            conn.execute("UPDATE results SET doc = ? WHERE key = ?", (_dumps(updated), key))
+            return doc
+        return await self._transaction(fetch)
+
+    async def cache_result(self, key: str, fields: Dict[str, Any]):
+        def upsert(conn):
+            row = conn.execute("SELECT doc FROM results WHERE key = ?", (key,)).fetchone()
+            doc = _loads(row[0]) if row else {"key": key, "created_at": datetime.utcnow(), "hits": 0}
+            doc.update(fields, last_used=datetime.utcnow())
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, file_unique_id, doc) VALUES (?, ?, ?)",
+                (key, doc.get("file_unique_id"), _dumps(doc))
+            )
+        await self._transaction(upsert)
+
+    async def delete_cached_result(self, key: str):
+        await self._run(self._conn.execute, "DELETE FROM results WHERE key = ?", (key,))
+
+    # Media info
+
+    async def get_media_info(self, key: str) -> Optional[Dict[str, Any]]:
+        # Rows created by save_keyframes alone have no probe document yet
+        return await self._fetch_doc("SELECT doc FROM media_info WHERE key = ? AND doc IS NOT NULL", (key,))
+
+    async def save_media_info(self, info: Dict[str, Any]):
+        await self._run(
+            self._conn.execute,
+            "INSERT INTO media_info (key, doc) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET doc = excluded.doc",
+            (info["key"], _dumps(info))
+        )
+
+    async def get_keyframes(self, key: str) -> Optional[List[float]]:
+        def fetch():
+            row = self._conn.execute("SELECT keyframes FROM media_info WHERE key = ?", (key,)).fetchone()
+            return json.loads(row[0]) if row and row[0] else None
+        return await self._run(fetch)
+
+    async def save_keyframes(self, key: str, keyframes: List[float]):
+        await self._run(
+            self._conn.execute,
+            "INSERT INTO media_info (key, keyframes) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET keyframes = excluded.keyframes",
+            (key, json.dumps(keyframes))
+        )
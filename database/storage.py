@@ -0,0 +1,159 @@
+import asyncio
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from config import config
+
+class ChangeFeedUnavailable(Exception):
+    """The backend can't push changes; callers should poll *_changed_since instead"""
+
+class Storage(ABC):
+    """Persistence used by DatabaseOperations and the in-process caches.
+
+    Documents go in and come out as plain dicts shaped like the pydantic
+    models in database.models. Backends only store and query; caching,
+    admission and write-behind batching stay above this interface.
+    """
+
+    @abstractmethod
+    async def initialize(self):
+        """Connect and create tables/indexes"""
+
+    async def close(self):
+        pass
+
+    # Users
+    @abstractmethod
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def insert_user(self, user: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def update_user(self, user_id: int, fields: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def update_user_stats(self, updates: Dict[int, Dict[str, Dict[str, Any]]]):
+        """Apply {"$inc": {...}, "$set": {...}} per user in one batch"""
+
+    # Settings
+    @abstractmethod
+    async def get_settings(self, user_id: int) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def save_settings(self, settings: Dict[str, Any]):
+        """Insert or fully replace a user's settings"""
+
+    @abstractmethod
+    async def update_settings(self, user_id: int, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Upsert fields and return the resulting document"""
+
+    @abstractmethod
+    async def settings_changed_since(self, since: datetime) -> List[Dict[str, Any]]: ...
+
+    # Jobs
+    @abstractmethod
+    async def insert_job(self, job: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def update_jobs(self, updates: Dict[str, Dict[str, Any]]):
+        """Set fields on many jobs, keyed by job_id"""
+
+    @abstractmethod
+    async def claim_job(self, worker_id: str, lease_until: datetime) -> Optional[Dict[str, Any]]:
+        """Atomically lease the oldest pending job"""
+
+    @abstractmethod
+    async def heartbeat_job(self, job_id: str, worker_id: str, lease_until: datetime) -> bool: ...
+
+    @abstractmethod
+    async def finish_job(self, job_id: str, worker_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Set fields if the worker still holds the lease; returns the job or None"""
+
+    @abstractmethod
+    async def release_job(self, job_id: str, worker_id: str): ...
+
+    @abstractmethod
+    async def requeue_expired_jobs(self, max_attempts: int) -> int: ...
+
+    @abstractmethod
+    async def active_jobs(self) -> List[Dict[str, Any]]:
+        """user_id and job_id of every pending or processing job"""
+
+    @abstractmethod
+    async def last_completions(self, since: datetime) -> Dict[int, datetime]:
+        """Latest completed end_time per user, for jobs finished after `since`"""
+
+    @abstractmethod
+    async def jobs_changed_since(self, since: datetime) -> List[Dict[str, Any]]: ...
+
+    # History
+    @abstractmethod
+    async def insert_history(self, entries: List[Dict[str, Any]]): ...
+
+    @abstractmethod
+    async def get_user_history(self, user_id: int, limit: int) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def increment_rollups(self, increments: Dict[Tuple[str, int, str], Dict[str, Any]]):
+        """Add counters to daily rollups keyed by (day, user_id, action), creating them as needed"""
+
+    @abstractmethod
+    async def get_rollups(self, user_id: int, since_day: str) -> List[Dict[str, Any]]: ...
+
+    # Result cache
+    @abstractmethod
+    async def get_cached_result(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached result and count the hit"""
+
+    @abstractmethod
+    async def cache_result(self, key: str, fields: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def delete_cached_result(self, key: str): ...
+
+    # Media info
+    @abstractmethod
+    async def get_media_info(self, key: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def save_media_info(self, info: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def get_keyframes(self, key: str) -> Optional[List[float]]: ...
+
+    @abstractmethod
+    async def save_keyframes(self, key: str, keyframes: List[float]): ...
+
+    # Change feed
+    async def watch(self, collection: str) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield the new document for each insert/update in `collection`, None for deletes"""
+        raise ChangeFeedUnavailable(f"{type(self).__name__} has no change feed")
+        yield
+
+_storage: Optional[Storage] = None
+_storage_lock = asyncio.Lock()
+
+async def get_storage() -> Storage:
+    """The configured backend, created and initialized on first use"""
+    global _storage
+    if _storage is None:
+        async with _storage_lock:
+            if _storage is None:
+                if config.STORAGE_BACKEND == "sqlite":
+                    from database.sqlite_storage import SQLiteStorage
+                    storage = SQLiteStorage(config.SQLITE_PATH)
+                elif config.STORAGE_BACKEND == "mongo":
+                    from database.mongo_storage import MongoStorage
+                    storage = MongoStorage()
+                else:
+                    raise ValueError(f"Unknown STORAGE_BACKEND: {config.STORAGE_BACKEND}")
+                await storage.initialize()
+                _storage = storage
+    return _storage
+
+async def close_storage():
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from config import config
+from database.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindBuffer:
+    """Buffers job updates, history inserts and usage counters off the request path.
+
+    Writes are merged while they wait: consecutive $set updates of one job
+    collapse into one, and per-user and daily rollup counters are summed. A
+    flush sends at most one batched write per collection. It runs when
+    BATCH_SIZE writes are pending or every FLUSH_INTERVAL seconds, and the
+    buffer is drained on shutdown. A failed flush keeps the writes for the
+    next attempt.
+    """
+
+    def __init__(self):
+        self._history: List[Dict[str, Any]] = []
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._users: Dict[int, Dict[str, Any]] = {}
+        self._rollups: Dict[Tuple[str, int, str], Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._pending_flush: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._history) + len(self._jobs) + len(self._users) + len(self._rollups)
+
+    def update_job(self, job_id: str, fields: Dict[str, Any]):
+        self._jobs.setdefault(job_id, {}).update(fields)
+        self._maybe_flush()
+
+    def add_history(self, entry: Dict[str, Any]):
+        if len(self._history) >= config.WRITE_BEHIND_MAX_PENDING:
+            logger.warning("Write-behind buffer full, dropping oldest history entry")
+            self._history.pop(0)
+        self._history.append(entry)
+        self._maybe_flush()
+
+    def update_user(self, user_id: int, inc: Dict[str, int], set_fields: Dict[str, Any]):
+        update = self._users.setdefault(user_id, {"$inc": {}, "$set": {}})
+        self._merge_inc(update["$inc"], inc)
+        update["$set"].update(set_fields)
+        self._maybe_flush()
+
+    def update_rollup(self, day: str, user_id: int, action: str, inc: Dict[str, Any]):
+        self._merge_inc(self._rollups.setdefault((day, user_id, action), {}), inc)
+        self._maybe_flush()
+
+    @staticmethod
+    def _merge_inc(target: Dict[str, Any], inc: Dict[str, Any]):
+        for name, value in inc.items():
+            target[name] = target.get(name, 0) + value
+
+    def _maybe_flush(self):
+        if self.pending >= config.WRITE_BEHIND_BATCH_SIZE and not self._pending_flush:
+            self._pending_flush = asyncio.create_task(self._flush_now())
+
+    async def _flush_now(self):
+        try:
+            await self.flush()
+        finally:
+            self._pending_flush = None
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        async with self._lock:
+            history, self._history = self._history, []
+            jobs, self._jobs = self._jobs, {}
+            users, self._users = self._users, {}
+            rollups, self._rollups = self._rollups, {}
+            if not (history or jobs or users or rollups):
+                return
+
+            try:
+                storage = await get_storage()
+                if jobs:
+                    await storage.update_jobs(jobs)
+                    jobs = {}
+                if history:
+                    await storage.insert_history(history)
+                    history = []
+                if users:
+                    await storage.update_user_stats(users)
+                    users = {}
+                if rollups:
+                    await storage.increment_rollups(rollups)
+                    rollups = {}
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, will retry: {e}")
+                self._restore(history, jobs, users, rollups)
+
+    def _restore(self, history, jobs, users, rollups):
+        # Put unwritten batches back in front of anything buffered meanwhile;
+        # no flush is triggered here, the next one comes from the interval
+        self._history = (history + self._history)[-config.WRITE_BEHIND_MAX_PENDING:]
+        for job_id, fields in jobs.items():
+            self._jobs[job_id] = {**fields, **self._jobs.get(job_id, {})}
+        for user_id, update in users.items():
+            newer = self._users.get(user_id, {"$inc": {}, "$set": {}})
+            inc = dict(update["$inc"])
+            for name, value in newer["$inc"].items():
+                inc[name] = inc.get(name, 0) + value
+            self._users[user_id] = {"$inc": inc, "$set": {**update["$set"], **newer["$set"]}}
+        for key, inc in rollups.items():
+            self._merge_inc(self._rollups.setdefault(key, {}), inc)
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic flush and drain what is left"""
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(config.WRITE_BEHIND_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush error: {e}")
+
+# Singleton instance
+write_behind = WriteBehindBuffer()
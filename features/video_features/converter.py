@@ -1,43 +1,49 @@
 import os
-from utils.ffmpeg_utils import FFmpegHandler
+from typing import Optional
+from utils.ffmpeg_utils import FFmpegHandler, ProgressCallback
+from utils.media_info import media_info
+from utils.pipeline import VideoPipeline
 from config import config
 
 class VideoConverter:
     @staticmethod
     async def convert_format(input_path: str, output_format: str, 
-                           quality: str = "medium") -> str:
-        """Convert video to different format"""
-        ffmpeg = FFmpegHandler()
-        
+                           quality: str = "medium", start: str = None,
+                           end: str = None, file_unique_id: Optional[str] = None,
+                           on_progress: Optional[ProgressCallback] = None) -> str:
+        """Convert video to different format, trimming in the same pass"""
         quality_settings = config.VIDEO_QUALITIES.get(quality, config.VIDEO_QUALITIES["720p"])
         
-        return await ffmpeg.convert_video(input_path, output_format, quality_settings)
+        pipeline = VideoPipeline().trim(start, end).quality(quality_settings).encode(output_format)
+        return await pipeline.run(input_path, file_unique_id=file_unique_id, on_progress=on_progress)
     
     @staticmethod
     async def convert_to_gif(input_path: str, start_time: str = "00:00:00",
                            duration: str = "00:00:05", fps: int = 10,
-                           width: int = 480) -> str:
+                           width: int = 480, on_progress: Optional[ProgressCallback] = None) -> str:
         """Convert video to GIF"""
-        ffmpeg = FFmpegHandler()
+        ffmpeg = FFmpegHandler(on_progress)
         return await ffmpeg.create_gif(input_path, start_time, duration, fps, width)
     
     @staticmethod
-    async def compress_video(input_path: str, target_size_mb: int) -> str:
+    async def compress_video(input_path: str, target_size_mb: int,
+                             file_unique_id: Optional[str] = None,
+                             on_progress: Optional[ProgressCallback] = None) -> str:
         """Compress video to target size"""
-        ffmpeg = FFmpegHandler()
-        return await ffmpeg.compress_video(input_path, target_size_mb)
+        ffmpeg = FFmpegHandler(on_progress)
+        return await ffmpeg.compress_video(input_path, target_size_mb, file_unique_id)
     
     @staticmethod
-    async def optimize_video(input_path: str) -> str:
+    async def optimize_video(input_path: str, file_unique_id: Optional[str] = None,
+                             on_progress: Optional[ProgressCallback] = None) -> str:
         """Optimize video for web"""
-        ffmpeg = FFmpegHandler()
+        ffmpeg = FFmpegHandler(on_progress)
         
         # Get original info
-        info = await ffmpeg.get_media_info(input_path)
+        info = await media_info.probe(input_path, file_unique_id)
         
         # Determine optimal settings
-        width = next((s.get('width') for s in info.get('streams', []) 
-                     if s.get('codec_type') == 'video'), 1920)
+        width = info.video.width if info.video and info.video.width else 1920
         
         if width > 1920:
             resolution = "1920x1080"
@@ -53,19 +59,14 @@ class VideoConverter:
         base = os.path.splitext(os.path.basename(input_path))[0]
         output = os.path.join(config.TEMP_DIR, f"optimized_{base}.mp4")
         
-        cmd = [
-            config.FFMPEG_PATH,
-            '-i', input_path,
+        video_args = [
             '-s', resolution,
             '-b:v', '1500k',
             '-c:v', 'libx264',
             '-preset', 'medium',
-            '-crf', '23',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            output,
-            '-y'
+            '-crf', '23'
         ]
+        audio_args = ['-c:a', 'aac', '-b:a', '128k']
         
-        await ffmpeg.run_command(cmd)
-        return output
+        return await ffmpeg.encode_video(input_path, output, video_args, audio_args,
+                                         file_unique_id=file_unique_id)
@@ -1,42 +1,60 @@
 import os
-from utils.ffmpeg_utils import FFmpegHandler
+from typing import Optional
+from utils.ffmpeg_utils import FFmpegHandler, ProgressCallback, format_time
+from utils.media_info import media_info
 
 class VideoTrimmer:
     @staticmethod
-    async def trim_video(input_path: str, start_time: str, end_time: str) -> str:
-        """Trim video between start and end times"""
-        ffmpeg = FFmpegHandler()
-        return await ffmpeg.trim_video(input_path, start_time, end_time)
+    async def trim_video(input_path: str, start_time: str, end_time: str,
+                         smart: bool = True, file_unique_id: Optional[str] = None,
+                         on_progress: Optional[ProgressCallback] = None) -> str:
+        """Trim video between start and end times.
+
+        Smart mode is frame accurate: the GOP-aligned middle is stream-copied
+        and only the partial GOPs at each edge are re-encoded.
+        """
+        ffmpeg = FFmpegHandler(on_progress)
+        if not smart:
+            return await ffmpeg.trim_video(input_path, start_time, end_time)
+        
+        info = await media_info.probe(input_path, file_unique_id)
+        keyframes = await media_info.keyframes(input_path, file_unique_id)
+        video = info.video
+        return await ffmpeg.smart_trim_video(
+            input_path, start_time, end_time, keyframes,
+            video.codec_name if video else None,
+            video.pix_fmt if video else None
+        )
     
     @staticmethod
-    async def auto_trim(video_path: str, threshold: float = 0.1) -> str:
+    async def auto_trim(video_path: str, threshold: float = 0.1,
+                        file_unique_id: Optional[str] = None,
+                        on_progress: Optional[ProgressCallback] = None) -> str:
         """Auto-trim silent parts"""
         # This is a simplified version
         # In production, you'd analyze audio for silence
-        ffmpeg = FFmpegHandler()
         
         # Get video info
-        info = await ffmpeg.get_media_info(video_path)
-        duration = float(info['format']['duration'])
+        info = await media_info.probe(video_path, file_unique_id)
+        duration = info.duration
         
         # For now, just trim first and last 5%
         start = duration * 0.05
         end = duration * 0.95
         
-        start_str = f"{int(start//3600):02d}:{int((start%3600)//60):02d}:{int(start%60):02d}"
-        end_str = f"{int(end//3600):02d}:{int((end%3600)//60):02d}:{int(end%60):02d}"
-        
-        return await ffmpeg.trim_video(video_path, start_str, end_str)
+        return await VideoTrimmer.trim_video(
+            video_path, format_time(start), format_time(end),
+            file_unique_id=file_unique_id, on_progress=on_progress
+        )
     
     @staticmethod
-    async def trim_by_scenes(video_path: str, scene_count: int = 10) -> list:
+    async def trim_by_scenes(video_path: str, scene_count: int = 10,
+                             file_unique_id: Optional[str] = None) -> list:
         """Trim video into scenes"""
         # This would use scene detection
         # For now, split equally
-        ffmpeg = FFmpegHandler()
-        
-        info = await ffmpeg.get_media_info(video_path)
-        duration = float(info['format']['duration'])
+        info = await media_info.probe(video_path, file_unique_id)
+        duration = info.duration
         segment_duration = duration / scene_count
         
         segments = []
@@ -44,10 +62,9 @@ class VideoTrimmer:
             start = i * segment_duration
             end = (i + 1) * segment_duration
             
-            start_str = f"{int(start//3600):02d}:{int((start%3600)//60):02d}:{int(start%60):02d}"
-            end_str = f"{int(end//3600):02d}:{int((end%3600)//60):02d}:{int(end%60):02d}"
-            
-            segment = await ffmpeg.trim_video(video_path, start_str, end_str)
+            segment = await VideoTrimmer.trim_video(
+                video_path, format_time(start), format_time(end), file_unique_id=file_unique_id
+            )
             segments.append(segment)
         
         return segments
@@ -10,8 +10,7 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get current settings
     settings_data = await DatabaseOperations.get_user_settings(user_id)
     if not settings_data:
-        await DatabaseOperations.init_user_settings(user_id)
-        settings_data = await DatabaseOperations.get_user_settings(user_id)
+        settings_data = await DatabaseOperations.init_user_settings(user_id)
     
     # Check premium
     premium = await is_premium_user(user_id)
@@ -33,6 +33,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     *Commands*:
     /start - Start the bot
     /settings - Configure bot settings
+    /stats - Show your usage
     /help - Show help
     
     *How to use*:
@@ -0,0 +1,44 @@
+from typing import Dict
+from telegram import Update
+from telegram.ext import ContextTypes
+from config import config
+from database.models import ALL_USERS, UsageRollup
+from database.operations import DatabaseOperations
+
+STATS_DAYS = 30
+
+def format_usage(title: str, usage: Dict[str, UsageRollup]) -> str:
+    """Render per-action rollup totals"""
+    if not usage:
+        return f"*{title}*\nNo activity yet."
+
+    lines = [f"*{title}*"]
+    for action, total in sorted(usage.items(), key=lambda item: -item[1].count):
+        lines.append(
+            f"• {action}: {total.count} files, {total.bytes // (1024*1024)} MB, "
+            f"{total.processing_seconds:.0f}s"
+            + (f", {total.failures} failed" if total.failures else "")
+        )
+
+    count = sum(total.count for total in usage.values())
+    size = sum(total.bytes for total in usage.values())
+    lines.append(f"Total: {count} files, {size // (1024*1024)} MB")
+    return "\n".join(lines)
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /stats command"""
+    user_id = update.effective_user.id
+
+    sections = [format_usage(
+        f"📊 Your usage (last {STATS_DAYS} days)",
+        await DatabaseOperations.get_usage(user_id, STATS_DAYS)
+    )]
+
+    # Admins also see totals across every user
+    if user_id in config.ADMIN_USER_IDS:
+        sections.append(format_usage(
+            f"🌐 All users (last {STATS_DAYS} days)",
+            await DatabaseOperations.get_usage(ALL_USERS, STATS_DAYS)
+        ))
+
+    await update.message.reply_text("\n\n".join(sections), parse_mode="Markdown")
@@ -1,11 +1,20 @@
-import os
 import asyncio
+import time
+import uuid
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from database.operations import DatabaseOperations
 from utils.premium import is_premium_user, check_wait_time
-from utils.ffmpeg_utils import FFmpegHandler
-from utils.progress import ProgressHandler
+from config import config
+from utils.progress import progress
+from utils.admission import admission
+from utils.tasks import TASKS, describe_error
+
+# Status text of the encodes long enough to be worth a progress bar; muting
+# is a stream copy and done before a bar would show anything
+PROGRESS_LABELS = {
+    "extract_audio": "🎵 Extracting audio..."
+}
 
 async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming video"""
@@ -23,11 +32,13 @@ async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Store video info
     context.user_data['current_video'] = {
         'file_id': video.file_id,
+        'file_unique_id': video.file_unique_id,
         'file_size': file_size,
         'duration': video.duration,
         'width': getattr(video, 'width', 0),
         'height': getattr(video, 'height', 0),
-        'file_name': getattr(video, 'file_name', f"video_{video.file_id}.mp4")
+        'file_name': getattr(video, 'file_name', f"video_{video.file_id}.mp4"),
+        'mime_type': getattr(video, 'mime_type', None)
     }
     
     # Show video options
@@ -135,6 +146,9 @@ async def video_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif action == "video_info":
         await show_video_info(query, video_info)
     
+    elif action == "video_info_deep":
+        await show_stream_info(query, video_info)
+    
     elif action == "video_cancel":
         await query.delete_message()
         if 'current_video' in context.user_data:
@@ -145,50 +159,18 @@ async def extract_thumbnail(query, video_info):
     await query.edit_message_text("🖼️ Extracting thumbnail...")
     
     try:
-        # Download video
-        file_path = await download_video(query.bot, video_info['file_id'])
-        
-        # Extract thumbnail
-        ffmpeg = FFmpegHandler()
-        thumbnail_path = await ffmpeg.extract_thumbnail(file_path)
-        
-        # Send thumbnail
-        with open(thumbnail_path, 'rb') as thumb:
-            await query.bot.send_photo(
-                chat_id=query.message.chat_id,
-                photo=thumb,
-                caption="✅ Thumbnail extracted!"
-            )
-        
-        # Cleanup
-        os.remove(file_path)
-        os.remove(thumbnail_path)
-        
+        await run_task(query, "thumbnail", video_info)
     except Exception as e:
-        await query.edit_message_text(f"❌ Error: {str(e)}")
+        await query.edit_message_text(describe_error(e))
 
 async def extract_audio(query, video_info):
     """Extract audio from video"""
     await query.edit_message_text("🎵 Extracting audio...")
     
     try:
-        file_path = await download_video(query.bot, video_info['file_id'])
-        
-        ffmpeg = FFmpegHandler()
-        audio_path = await ffmpeg.extract_audio(file_path)
-        
-        with open(audio_path, 'rb') as audio:
-            await query.bot.send_audio(
-                chat_id=query.message.chat_id,
-                audio=audio,
-                caption="✅ Audio extracted!"
-            )
-        
-        os.remove(file_path)
-        os.remove(audio_path)
-        
+        await run_task(query, "extract_audio", video_info)
     except Exception as e:
-        await query.edit_message_text(f"❌ Error: {str(e)}")
+        await query.edit_message_text(describe_error(e))
 
 async def trim_video(query, video_info):
     """Trim video"""
@@ -209,23 +191,9 @@ async def mute_video(query, video_info):
     await query.edit_message_text("🔇 Removing audio...")
     
     try:
-        file_path = await download_video(query.bot, video_info['file_id'])
-        
-        ffmpeg = FFmpegHandler()
-        muted_path = await ffmpeg.remove_audio(file_path)
-        
-        with open(muted_path, 'rb') as video:
-            await query.bot.send_video(
-                chat_id=query.message.chat_id,
-                video=video,
-                caption="✅ Audio removed!"
-            )
-        
-        os.remove(file_path)
-        os.remove(muted_path)
-        
+        await run_task(query, "mute", video_info)
     except Exception as e:
-        await query.edit_message_text(f"❌ Error: {str(e)}")
+        await query.edit_message_text(describe_error(e))
 
 async def convert_to_audio(query, video_info):
     """Convert video to audio"""
@@ -265,43 +233,83 @@ async def show_conversion_options(query):
     )
 
 async def show_video_info(query, video_info):
-    """Show video information"""
-    try:
-        file_path = await download_video(query.bot, video_info['file_id'])
-        
-        ffmpeg = FFmpegHandler()
-        info = await ffmpeg.get_media_info(file_path)
-        
-        text = f"""
+    """Show video information Telegram already gave us, without downloading"""
+    keyboard = [[InlineKeyboardButton("🔬 Stream Details", callback_data="video_info_deep")]]
+    
+    text = f"""
         📊 *Media Information*
         
-        *General*:
-        • Format: {info.get('format', {}).get('format_name', 'N/A')}
-        • Duration: {float(info.get('format', {}).get('duration', 0)):.2f}s
-        • Size: {int(info.get('format', {}).get('size', 0)) // (1024*1024)} MB
-        • Bitrate: {int(info.get('format', {}).get('bit_rate', 0)) // 1000} kbps
-        
-        *Video Stream*:
-        • Codec: {next((s.get('codec_name') for s in info.get('streams', []) if s.get('codec_type') == 'video'), 'N/A')}
-        • Resolution: {next((f"{s.get('width')}x{s.get('height')}" for s in info.get('streams', []) if s.get('codec_type') == 'video'), 'N/A')}
-        • FPS: {next((eval(s.get('avg_frame_rate', '0')) for s in info.get('streams', []) if s.get('codec_type') == 'video'), 0):.2f}
-        
-        *Audio Stream*:
-        • Codec: {next((s.get('codec_name') for s in info.get('streams', []) if s.get('codec_type') == 'audio'), 'N/A')}
-        • Channels: {next((s.get('channels') for s in info.get('streams', []) if s.get('codec_type') == 'audio'), 'N/A')}
-        • Sample Rate: {next((s.get('sample_rate') for s in info.get('streams', []) if s.get('codec_type') == 'audio'), 'N/A')} Hz
+        • Name: `{video_info.get('file_name', 'Unknown')}`
+        • Type: {video_info.get('mime_type') or 'N/A'}
+        • Size: {(video_info.get('file_size') or 0) // (1024*1024)} MB
+        • Duration: {video_info.get('duration', 0)}s
+        • Resolution: {video_info.get('width', 0)}x{video_info.get('height', 0)}
         """
-        
-        await query.edit_message_text(text, parse_mode="Markdown")
-        
-        os.remove(file_path)
-        
+    
+    await query.edit_message_text(
+        text,
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode="Markdown"
+    )
+
+async def show_stream_info(query, video_info):
+    """Show codec details probed from the container header"""
+    await query.edit_message_text("🔬 Reading stream details...")
+    
+    try:
+        result = await run_task(query, "info", video_info)
+        if result:
+            await query.edit_message_text(result["text"], parse_mode="Markdown")
     except Exception as e:
-        await query.edit_message_text(f"❌ Error: {str(e)}")
+        await query.edit_message_text(describe_error(e))
+
+async def run_task(query, action, video_info):
+    """Run a media task here, or hand it to worker.py when USE_JOB_WORKER is set"""
+    user_id = query.from_user.id
+    chat_id = query.message.chat_id
+    
+    if config.USE_JOB_WORKER:
+        await DatabaseOperations.create_job(
+            user_id, video_info['file_id'], "video", action,
+            chat_id=chat_id, params=video_info
+        )
+        await query.edit_message_text("📥 Queued for processing, the result will be sent here.")
+        return None
+    
+    # Inline runs have no job document, so report them to admission directly
+    job_id = uuid.uuid4().hex
+    status = "failed"
+    cooldown = False
+    started = time.monotonic()
+    admission.job_started(user_id, job_id, local=True)
+    try:
+        result = await TASKS[action](
+            query.bot, chat_id, user_id, video_info, on_queued=queue_status(query),
+            on_progress=encode_status(query, action, video_info)
+        )
+        status = "completed"
+        # Header probes and resent cached results don't start the free-user wait
+        cooldown = action != "info" and not (result or {}).get("cached")
+        return result
+    finally:
+        admission.job_finished(user_id, job_id, status, cooldown=cooldown)
+        # A coalesced edit still pending must not overwrite the result or error text
+        progress.forget(chat_id, query.message.message_id)
+        await DatabaseOperations.add_history(
+            user_id, action, "video", video_info.get('file_size', 0), status,
+            time.monotonic() - started
+        )
+
+def encode_status(query, action, video_info):
+    """Progress callback that renders an encode into the status message, for long videos only"""
+    label = PROGRESS_LABELS.get(action)
+    duration = video_info.get('duration') or 0
+    if label is None or duration < config.PROGRESS_MIN_DURATION:
+        return None
+    return progress.ffmpeg_callback(query.message.chat_id, query.message.message_id, label, duration)
 
-async def download_video(bot, file_id):
-    """Download video from Telegram"""
-    file = await bot.get_file(file_id)
-    file_path = os.path.join("temp", f"video_{file_id}.mp4")
-    await file.download_to_drive(file_path)
-    return file_path
+def queue_status(query):
+    """Build a callback that tells the user where their job sits in the queue"""
+    async def report(position: int, eta: int):
+        await query.edit_message_text(f"⏳ Queued: position {position}, ETA ~{eta}s")
+    return report
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set
+from config import config
+from database.storage import ChangeFeedUnavailable, get_storage
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("pending", "processing")
+
+class AdmissionController:
+    """Per-user active job counts and last completion times, held in memory.
+
+    Admission checks read only these maps. They are warmed from the jobs
+    collection at startup, updated directly by the job lifecycle calls in
+    this process, and follow jobs finished elsewhere (worker.py) through the
+    storage change feed, or by polling when there is none.
+    Events are keyed by job_id, so seeing the same transition twice is harmless.
+    """
+
+    def __init__(self):
+        self._active: Dict[int, Set[str]] = {}
+        self._last_completed: Dict[int, datetime] = {}
+        self._owners: Dict[str, int] = {}
+        # Inline runs in this process have no job document, so warm() can't see them
+        self._local: Dict[str, int] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    def active_jobs(self, user_id: int) -> int:
+        return len(self._active.get(user_id, ()))
+
+    def wait_left(self, user_id: int) -> float:
+        """Seconds a free user still has to wait after their last completed job"""
+        last = self._last_completed.get(user_id)
+        if last is None:
+            return 0.0
+        left = (last + timedelta(seconds=config.FREE_USER_WAIT_TIME) - datetime.utcnow()).total_seconds()
+        if left <= 0:
+            del self._last_completed[user_id]
+            return 0.0
+        return left
+
+    def job_started(self, user_id: int, job_id: str, local: bool = False):
+        self._active.setdefault(user_id, set()).add(job_id)
+        self._owners[job_id] = user_id
+        if local:
+            self._local[job_id] = user_id
+
+    def job_updated(self, job_id: str, status: str, end_time: Optional[datetime] = None):
+        """Status change for a job known only by id; unknown jobs arrive via the watcher"""
+        user_id = self._owners.get(job_id)
+        if user_id is None:
+            return
+        if status in ACTIVE_STATUSES:
+            self.job_started(user_id, job_id)
+        else:
+            self.job_finished(user_id, job_id, status, end_time)
+
+    def job_finished(self, user_id: int, job_id: str, status: str,
+                     end_time: Optional[datetime] = None, cooldown: bool = True):
+        """`cooldown=False` for completions that shouldn't start the free-user wait"""
+        self._owners.pop(job_id, None)
+        self._local.pop(job_id, None)
+        jobs = self._active.get(user_id)
+        if jobs is not None:
+            jobs.discard(job_id)
+            if not jobs:
+                del self._active[user_id]
+
+        if status == "completed" and cooldown:
+            end_time = end_time or datetime.utcnow()
+            if end_time > self._last_completed.get(user_id, datetime.min):
+                self._last_completed[user_id] = end_time
+
+    def apply(self, job: Dict[str, Any]):
+        """Fold a job document into the counters"""
+        if job["status"] in ACTIVE_STATUSES:
+            self.job_started(job["user_id"], job["job_id"])
+        else:
+            self.job_finished(job["user_id"], job["job_id"], job["status"], job.get("end_time"))
+
+    async def warm(self):
+        """Rebuild state from storage; only jobs that can still affect admission are read"""
+        storage = await get_storage()
+        active: Dict[int, Set[str]] = {}
+        owners: Dict[str, int] = {}
+        for job in await storage.active_jobs():
+            active.setdefault(job["user_id"], set()).add(job["job_id"])
+            owners[job["job_id"]] = job["user_id"]
+
+        since = datetime.utcnow() - timedelta(seconds=config.FREE_USER_WAIT_TIME)
+        last_completed = await storage.last_completions(since)
+
+        # Keep what storage doesn't know: inline jobs still running here and
+        # cooldowns they started
+        for job_id, user_id in self._local.items():
+            active.setdefault(user_id, set()).add(job_id)
+            owners[job_id] = user_id
+        for user_id, end_time in self._last_completed.items():
+            if end_time > last_completed.get(user_id, datetime.min):
+                last_completed[user_id] = end_time
+
+        self._active = active
+        self._owners = owners
+        self._last_completed = last_completed
+        logger.info(f"Admission warmed: {sum(map(len, active.values()))} active jobs, "
+                    f"{len(last_completed)} users in cooldown")
+
+    async def start(self):
+        await self.warm()
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self):
+        storage = await get_storage()
+        while True:
+            try:
+                logger.info("Admission following jobs change feed")
+                async for job in storage.watch("jobs"):
+                    if job:
+                        self.apply(job)
+            except ChangeFeedUnavailable as e:
+                logger.info(f"Change feed unavailable ({e}), polling jobs instead")
+                await self._poll()
+                return
+            except Exception as e:
+                logger.warning(f"Jobs change feed interrupted: {e}")
+                await asyncio.sleep(config.ADMISSION_POLL_INTERVAL)
+                try:
+                    # Events were missed while disconnected
+                    await self.warm()
+                except Exception as warm_error:
+                    logger.warning(f"Admission re-warm failed: {warm_error}")
+
+    async def _poll(self):
+        storage = await get_storage()
+        since = datetime.utcnow()
+        overlap = timedelta(seconds=config.ADMISSION_POLL_INTERVAL)
+        while True:
+            await asyncio.sleep(config.ADMISSION_POLL_INTERVAL)
+            try:
+                now = datetime.utcnow()
+                # Jobs created or finished since the last poll
+                for job in await storage.jobs_changed_since(since - overlap):
+                    self.apply(job)
+                since = now
+            except Exception as e:
+                logger.warning(f"Admission poll failed: {e}")
+
+# Singleton instance
+admission = AdmissionController()
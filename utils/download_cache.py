@@ -0,0 +1,200 @@
+import asyncio
+import fcntl
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, List, Optional
+from config import config
+from utils.downloader import downloader
+from utils.workspace import workspaces
+
+logger = logging.getLogger(__name__)
+
+class DownloadCache:
+    """On-disk LRU cache of Telegram files keyed by file_unique_id.
+
+    Every cached file has a sibling ``.lock`` file. A process holds a shared
+    flock on it while using the file and an exclusive one while downloading or
+    evicting, so several bot processes on one host can share the directory.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size: Optional[int] = None):
+        self.cache_dir = cache_dir or config.CACHE_DIR
+        self.max_size = max_size or config.CACHE_MAX_SIZE
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_downloaded = 0
+
+    @asynccontextmanager
+    async def fetch(self, bot, file_id: str, file_unique_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield a local path for the file, downloading it only if needed"""
+        if not file_unique_id:
+            # Without a stable identity we cannot share the file; download into
+            # a workspace so the file and any partial leftovers go with it
+            async with workspaces.job("download") as workspace:
+                path = workspace.file("video.mp4")
+                await self._download(bot, file_id, path)
+                yield path
+            return
+
+        path = self._path(file_unique_id)
+        downloaded = False
+        while True:
+            # Readers share the lock, so requests for a cached file never wait
+            # on each other; only a miss escalates to the exclusive download lock
+            lock_fd = await self._lock(file_unique_id, fcntl.LOCK_SH)
+            if os.path.exists(path):
+                if not downloaded:
+                    self.hits += 1
+                    self.bytes_saved += os.path.getsize(path)
+                break
+            os.close(lock_fd)
+            # Another process may also evict it between download and shared lock
+            downloaded = await self._ensure(bot, file_id, file_unique_id) or downloaded
+
+        try:
+            os.utime(path)  # mtime doubles as the LRU timestamp
+            yield path
+        finally:
+            os.close(lock_fd)
+
+    def cached(self, file_unique_id: Optional[str]) -> bool:
+        """Whether a file is on disk right now, so fetching it needs no space"""
+        return bool(file_unique_id) and os.path.exists(self._path(file_unique_id))
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache effectiveness counters"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "bytes_downloaded": self.bytes_downloaded
+        }
+
+    async def _ensure(self, bot, file_id: str, key: str) -> bool:
+        """Download a missing file under the exclusive lock; True if this call downloaded it.
+
+        Concurrent callers in this process share one download.
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The downloading caller went away; take over the download
+                return await self._ensure(bot, file_id, key)
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            path = self._path(key)
+            lock_fd = await self._lock(key, fcntl.LOCK_EX)
+            try:
+                # Re-check: another process may have downloaded it meanwhile
+                downloaded = not os.path.exists(path)
+                if downloaded:
+                    self.misses += 1
+                    await self._download(bot, file_id, path)
+                    self.bytes_downloaded += os.path.getsize(path)
+            finally:
+                os.close(lock_fd)
+            future.set_result(path)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; avoid "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        await self._evict(keep=key)
+        return downloaded
+
+    async def _download(self, bot, file_id: str, path: str):
+        await downloader.download(bot, file_id, path)
+
+    async def _evict(self, keep: Optional[str] = None):
+        """Drop least recently used files until the cache fits its size budget.
+
+        Interrupted downloads leave a ``.part`` file and its range sidecar so a
+        later request resumes them; they count against the budget under their key.
+        """
+        files: Dict[str, List[str]] = {}
+        mtimes: Dict[str, float] = {}
+        sizes: Dict[str, int] = {}
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".lock"):
+                continue
+            key = name.split(".", 1)[0]
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            files.setdefault(key, []).append(name)
+            mtimes[key] = max(mtimes.get(key, 0.0), stat.st_mtime)
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+
+        total = sum(sizes.values())
+        for key in sorted(files, key=mtimes.get):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            lock_fd = self._try_lock(key, fcntl.LOCK_EX)
+            if lock_fd is None:
+                continue  # in use, here or in another process
+            try:
+                # The lock file goes too; _try_lock notices a waiter that
+                # locked the unlinked inode and retries on a fresh one
+                for name in files[key] + [f"{key}.lock"]:
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except FileNotFoundError:
+                        pass
+                total -= sizes[key]
+                logger.info(f"Evicted {key} ({sizes[key]} bytes) from download cache")
+            finally:
+                os.close(lock_fd)
+
+    async def _lock(self, key: str, mode: int) -> int:
+        """Acquire a flock without blocking the event loop"""
+        while True:
+            fd = self._try_lock(key, mode)
+            if fd is not None:
+                return fd
+            await asyncio.sleep(0.1)
+
+    def _try_lock(self, key: str, mode: int) -> Optional[int]:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        lock_path = f"{self._path(key)}.lock"
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        try:
+            current = os.stat(lock_path).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(fd).st_ino:
+            # Evicted while we waited; this lock no longer guards anything
+            os.close(fd)
+            return None
+        return fd
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+# Singleton instance
+download_cache = DownloadCache()
@@ -0,0 +1,248 @@
+import asyncio
+import errno
+import json
+import logging
+import os
+import shutil
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+import aiohttp
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Called with (bytes written so far, total size or 0 if unknown)
+DownloadCallback = Callable[[int, int], Awaitable[None]]
+
+# Inclusive byte range; end is None when the size is unknown
+ByteRange = Tuple[int, Optional[int]]
+
+class RangeNotSupported(Exception):
+    """The server answered a ranged request with the whole body"""
+
+class Downloader:
+    """Streams Telegram files to disk in fixed-size chunks.
+
+    python-telegram-bot's download helpers read the whole body into memory
+    before writing it, so a 2 GB file costs 2 GB of RAM. Here each connection
+    holds one chunk plus aiohttp's read buffer, whatever the file size.
+
+    Large files are split into DOWNLOAD_RANGE_SIZE ranges fetched over
+    DOWNLOAD_CONNECTIONS pooled connections. Completed ranges are recorded in
+    a sidecar next to the ``.part`` file, so retries, and later attempts at the
+    same path, only fetch what is missing. With a local Bot API server
+    (BOT_API_LOCAL_MODE) files are hardlinked or copied from its directory
+    instead of going over HTTP.
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None, connections: Optional[int] = None,
+                 range_size: Optional[int] = None):
+        self.chunk_size = chunk_size or config.DOWNLOAD_CHUNK_SIZE
+        self.connections = connections or config.DOWNLOAD_CONNECTIONS
+        self.range_size = range_size or config.DOWNLOAD_RANGE_SIZE
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Shared by every download so connections to the Bot API are reused
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=config.DOWNLOAD_READ_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=config.DOWNLOAD_POOL_SIZE)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def download(self, bot, file_id: str, path: str,
+                       on_progress: Optional[DownloadCallback] = None) -> str:
+        """Download a file to `path`, which only appears once it is complete"""
+        file = await bot.get_file(file_id)
+        return await self.download_file(file, path, on_progress)
+
+    async def download_file(self, file, path: str, on_progress: Optional[DownloadCallback] = None) -> str:
+        """Download an already resolved telegram.File"""
+        total = file.file_size or 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # In local mode the Bot API server hands out paths on its own disk
+        if os.path.isabs(file.file_path) and os.path.isfile(file.file_path):
+            await asyncio.to_thread(self._link_or_copy, file.file_path, path)
+            if on_progress:
+                size = os.path.getsize(path)
+                await self._report(on_progress, size, total or size)
+            return path
+
+        return await self.download_url(file.file_path, path, total, on_progress)
+
+    async def download_url(self, url: str, path: str, total: int = 0,
+                           on_progress: Optional[DownloadCallback] = None) -> str:
+        """Fetch `url` into `path`, in parallel ranges when the size is known and large"""
+        partial = f"{path}.part"
+        state_path = f"{partial}.ranges"
+        ranges = self._ranges(total)
+        done = self._load_state(partial, state_path, total)
+        complete = False
+
+        fd = os.open(partial, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not done:
+                os.ftruncate(fd, 0)
+                self._preallocate(fd, total)
+
+            for attempt in range(config.DOWNLOAD_RETRIES + 1):
+                try:
+                    await self._fetch_ranges(url, fd, ranges, done, total, state_path, on_progress)
+                    break
+                except RangeNotSupported:
+                    logger.info("Server ignores Range requests, downloading sequentially")
+                    ranges = [(0, total - 1)]
+                    done = set()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == config.DOWNLOAD_RETRIES:
+                        raise
+                    delay = min(2 ** attempt, 30)
+                    logger.warning(
+                        f"Download interrupted ({e}); {len(ranges) - len(done)} of {len(ranges)} "
+                        f"ranges left, retrying in {delay}s"
+                    )
+                    await asyncio.sleep(delay)
+            else:
+                raise Exception(f"Download failed after {config.DOWNLOAD_RETRIES + 1} attempts")
+
+            # The preallocated file is already full size, so check ranges, not st_size
+            if len(done) != len(ranges):
+                raise Exception(f"Download incomplete: {len(done)} of {len(ranges)} ranges")
+            complete = True
+        finally:
+            os.close(fd)
+            # A partial file of known size is kept with its sidecar so the
+            # next attempt resumes; without a size there is nothing to resume
+            if not complete and not total:
+                self._remove(partial, state_path)
+
+        os.replace(partial, path)
+        self._remove(state_path)
+        return path
+
+    async def _fetch_ranges(self, url: str, fd: int, ranges: List[ByteRange], done: Set[int],
+                            total: int, state_path: str, on_progress: Optional[DownloadCallback]):
+        pending = [index for index in range(len(ranges)) if index not in done]
+        written = [sum(self._length(ranges[index], total) for index in done)]
+        ranged = len(ranges) > 1
+
+        async def fetch(index: int):
+            start, end = ranges[index]
+            headers = {"Range": f"bytes={start}-{end}"} if ranged else {}
+            offset = start
+            try:
+                async with self._get_session().get(url, headers=headers) as response:
+                    response.raise_for_status()
+                    if ranged and response.status != 206:
+                        raise RangeNotSupported(url)
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        written[0] += len(chunk)
+                        if on_progress:
+                            await self._report(on_progress, written[0], total)
+            except BaseException:
+                # A half-written range is fetched again from its start
+                written[0] -= offset - start
+                raise
+
+            if end is None:
+                # Unknown size: the file is whatever the body was
+                os.ftruncate(fd, offset)
+            elif offset != end + 1:
+                written[0] -= offset - start
+                raise aiohttp.ClientPayloadError(f"Range {start}-{end} ended at byte {offset}")
+            done.add(index)
+            if ranged:
+                self._save_state(state_path, total, done)
+
+        async def worker():
+            while pending:
+                await fetch(pending.pop(0))
+
+        tasks = [asyncio.create_task(worker()) for _ in range(min(self.connections, len(pending)))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def _ranges(self, total: int) -> List[ByteRange]:
+        if not total:
+            return [(0, None)]
+        if total < config.DOWNLOAD_PARALLEL_MIN_SIZE:
+            return [(0, total - 1)]
+        return [(start, min(start + self.range_size, total) - 1) for start in range(0, total, self.range_size)]
+
+    @staticmethod
+    def _length(byte_range: ByteRange, total: int) -> int:
+        start, end = byte_range
+        return (end if end is not None else total - 1) - start + 1
+
+    def _load_state(self, partial: str, state_path: str, total: int) -> Set[int]:
+        """Ranges already on disk from an earlier attempt at the same file"""
+        if not total or not os.path.exists(partial):
+            return set()
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if state.get("size") != total or state.get("range_size") != self.range_size:
+            return set()
+        return set(state.get("done", []))
+
+    def _save_state(self, state_path: str, total: int, done: Set[int]):
+        temp = f"{state_path}.tmp"
+        with open(temp, 'w') as f:
+            json.dump({"size": total, "range_size": self.range_size, "done": sorted(done)}, f)
+        os.replace(temp, state_path)
+
+    @staticmethod
+    def _link_or_copy(source: str, path: str):
+        partial = f"{path}.part"
+        if os.path.exists(partial):
+            os.remove(partial)
+        try:
+            os.link(source, partial)
+        except OSError:
+            # Different filesystem or links not permitted
+            shutil.copyfile(source, partial)
+        os.replace(partial, path)
+
+    @staticmethod
+    async def _report(on_progress: DownloadCallback, written: int, total: int):
+        try:
+            await on_progress(written, total)
+        except Exception as e:
+            logger.warning(f"Download progress callback failed: {e}")
+
+    @staticmethod
+    def _remove(*paths: str):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _preallocate(fd: int, size: int):
+        """Reserve the blocks up front so a full disk fails fast and the file isn't fragmented"""
+        if size <= 0 or not hasattr(os, "posix_fallocate"):
+            return
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as e:
+            # ENOSPC should abort; filesystems without fallocate just skip it
+            if e.errno == errno.ENOSPC:
+                raise
+            logger.debug(f"posix_fallocate unsupported: {e}")
+
+# Singleton instance
+downloader = Downloader()
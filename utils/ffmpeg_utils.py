@@ -1,47 +1,184 @@
 import asyncio
+import codecs
+import logging
 import os
 import json
+import re
 import subprocess
-from typing import Dict, Any, List, Optional
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Any, Awaitable, Callable, Deque, List, Optional, Sequence
 from config import config
+from utils.scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Encoders used to re-encode partial GOPs so they concat with stream-copied video
+SMART_TRIM_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+
+def parse_time(value) -> float:
+    """Seconds from `HH:MM:SS[.ms]`, `MM:SS` or a plain number"""
+    seconds = 0.0
+    for part in str(value).split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def format_time(seconds: float) -> str:
+    """`HH:MM:SS.mmm` for FFmpeg"""
+    hours, rest = divmod(round(max(seconds, 0.0), 3), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+@dataclass
+class FFmpegProgress:
+    """One block of `-progress` output"""
+    frame: int = 0
+    fps: float = 0.0
+    out_time: float = 0.0  # seconds of output written
+    size: int = 0  # bytes
+    speed: float = 0.0  # multiple of realtime
+    done: bool = False
+
+ProgressCallback = Callable[[FFmpegProgress], Awaitable[None]]
+
+class FFmpegError(Exception):
+    """FFmpeg exited with an error; the message is for logs, not for users"""
+
+def redact(text: str, args: Sequence[str] = ()) -> str:
+    """Strip Bot API file URLs and the bot token from FFmpeg output.
+
+    Remote inputs are `https://api.telegram.org/file/bot<TOKEN>/...`, and
+    ffmpeg names its input in most error messages.
+    """
+    for arg in args:
+        if "://" in arg:
+            text = text.replace(arg, "<input>")
+    if config.BOT_TOKEN:
+        text = text.replace(config.BOT_TOKEN, "<token>")
+    return text
+
+def _number(value: str, cast=float):
+    try:
+        return cast(value.rstrip('x'))
+    except ValueError:
+        return cast(0)
 
 class FFmpegHandler:
-    def __init__(self):
+    def __init__(self, progress_callback: Optional[ProgressCallback] = None,
+                 workdir: Optional[str] = None):
         self.ffmpeg = config.FFMPEG_PATH
         self.ffprobe = config.FFPROBE_PATH
+        self.progress_callback = progress_callback
+        # Outputs go here; callers pass a job workspace so they get cleaned up
+        self.workdir = workdir or config.TEMP_DIR
     
-    async def run_command(self, cmd: List[str]) -> str:
-        """Run FFmpeg command"""
+    async def run_command(self, cmd: List[str], progress_callback: Optional[ProgressCallback] = None) -> str:
+        """Run FFmpeg command.
+        
+        Output is consumed incrementally: stderr is kept only as a bounded tail
+        for error messages, and ffmpeg commands report `-progress` events to
+        progress_callback (this call's, else the handler's) while they run.
+        """
+        progress_callback = progress_callback or self.progress_callback
+        report_progress = progress_callback is not None and cmd[0] == self.ffmpeg
+        if report_progress:
+            cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+        
         process = await asyncio.create_subprocess_exec(
             *cmd,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
         
-        stdout, stderr = await process.communicate()
+        stdout: List[bytes] = []
+        stderr_tail: Deque[str] = deque(maxlen=config.FFMPEG_STDERR_LINES)
+        
+        async def read_stdout():
+            if report_progress:
+                await self._read_progress(process.stdout, progress_callback)
+                return
+            while True:
+                chunk = await process.stdout.read(65536)
+                if not chunk:
+                    break
+                stdout.append(chunk)
+        
+        try:
+            await asyncio.gather(read_stdout(), self._read_lines(process.stderr, stderr_tail))
+            await process.wait()
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
         
         if process.returncode != 0:
-            raise Exception(f"FFmpeg error: {stderr.decode()}")
+            stderr = "\n".join(stderr_tail)
+            raise FFmpegError(f"FFmpeg error: {redact(stderr, cmd)}")
         
-        return stdout.decode()
+        return b''.join(stdout).decode()
+    
+    @staticmethod
+    async def _read_progress(stream: asyncio.StreamReader, progress_callback: ProgressCallback):
+        """Parse key=value blocks from `-progress` output and emit an event per block"""
+        event = FFmpegProgress()
+        async for raw in stream:
+            key, _, value = raw.decode(errors="replace").strip().partition('=')
+            if key == 'frame':
+                event.frame = _number(value, int)
+            elif key == 'fps':
+                event.fps = _number(value)
+            elif key == 'out_time_us':
+                event.out_time = _number(value, int) / 1_000_000
+            elif key == 'total_size':
+                event.size = _number(value, int)
+            elif key == 'speed':
+                event.speed = _number(value)
+            elif key == 'progress':
+                event.done = value == 'end'
+                try:
+                    await progress_callback(event)
+                except Exception as e:
+                    logger.warning(f"Progress callback failed: {e}")
+                event = FFmpegProgress(**vars(event))
+    
+    @staticmethod
+    async def _read_lines(stream: asyncio.StreamReader, tail: Deque[str]):
+        """Keep the last lines of a stream; ffmpeg separates stats updates with \\r"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors="replace")
+        pending = ''
+        while True:
+            chunk = await stream.read(4096)
+            if not chunk:
+                break
+            lines = re.split(r'[\r\n]+', pending + decoder.decode(chunk))
+            pending = lines.pop()[-4096:]
+            tail.extend(line for line in lines if line)
+        if pending:
+            tail.append(pending)
     
-    async def get_media_info(self, file_path: str) -> Dict[str, Any]:
+    async def get_media_info(self, file_path: str, probe_size: Optional[int] = None) -> Dict[str, Any]:
         """Get media information"""
         cmd = [
             self.ffprobe,
             '-v', 'quiet',
             '-print_format', 'json',
             '-show_format',
-            '-show_streams',
-            file_path
+            '-show_streams'
         ]
         
+        # Limit how much of the input is read, e.g. when probing over HTTP
+        if probe_size:
+            cmd.extend(['-probesize', str(probe_size)])
+        
+        cmd.append(file_path)
+        
         result = await self.run_command(cmd)
         return json.loads(result)
     
     async def extract_thumbnail(self, video_path: str, time: str = "00:00:01") -> str:
         """Extract thumbnail from video"""
-        output = os.path.join(config.TEMP_DIR, f"thumb_{os.path.basename(video_path)}.jpg")
+        output = os.path.join(self.workdir, f"thumb_{os.path.basename(video_path)}.jpg")
         
         cmd = [
             self.ffmpeg,
@@ -59,7 +196,7 @@ class FFmpegHandler:
     async def extract_audio(self, video_path: str, format: str = "mp3", bitrate: str = "192k") -> str:
         """Extract audio from video"""
         base = os.path.splitext(os.path.basename(video_path))[0]
-        output = os.path.join(config.TEMP_DIR, f"{base}.{format}")
+        output = os.path.join(self.workdir, f"{base}.{format}")
         
         cmd = [
             self.ffmpeg,
@@ -76,7 +213,7 @@ class FFmpegHandler:
     
     async def remove_audio(self, video_path: str) -> str:
         """Remove audio from video"""
-        output = os.path.join(config.TEMP_DIR, f"muted_{os.path.basename(video_path)}")
+        output = os.path.join(self.workdir, f"muted_{os.path.basename(video_path)}")
         
         cmd = [
             self.ffmpeg,
@@ -90,16 +227,40 @@ class FFmpegHandler:
         await self.run_command(cmd)
         return output
     
+    async def get_keyframes(self, video_path: str) -> List[float]:
+        """Keyframe timestamps of the first video stream, read from packet flags without decoding"""
+        cmd = [
+            self.ffprobe,
+            '-v', 'quiet',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            video_path
+        ]
+        
+        result = await self.run_command(cmd)
+        keyframes = []
+        for line in result.splitlines():
+            pts_time, _, flags = line.partition(',')
+            if 'K' in flags and pts_time not in ('', 'N/A'):
+                keyframes.append(float(pts_time))
+        return sorted(keyframes)
+    
     async def trim_video(self, video_path: str, start: str, end: str) -> str:
-        """Trim video"""
-        output = os.path.join(config.TEMP_DIR, f"trimmed_{os.path.basename(video_path)}")
+        """Trim video (stream copy; cuts snap to keyframes)"""
+        start_seconds = parse_time(start)
+        output = self._trim_output(video_path, start_seconds, parse_time(end),
+                                   os.path.splitext(video_path)[1])
         
+        # Seeking on the input jumps straight to the nearest keyframe instead of
+        # demuxing everything before the start point
         cmd = [
             self.ffmpeg,
+            '-ss', format_time(start_seconds),
+            '-t', format_time(parse_time(end) - start_seconds),
             '-i', video_path,
-            '-ss', start,
-            '-to', end,
             '-c', 'copy',
+            '-avoid_negative_ts', 'make_zero',
             output,
             '-y'
         ]
@@ -107,31 +268,262 @@ class FFmpegHandler:
         await self.run_command(cmd)
         return output
     
+    def _split_progress(self, count: int) -> List[Optional[ProgressCallback]]:
+        """Callbacks for commands run side by side whose outputs add up to the result.
+
+        Each reports its own out_time, so their sum is the progress of the whole.
+        """
+        if self.progress_callback is None:
+            return [None] * count
+        out_times = [0.0] * count
+        speeds = [0.0] * count
+        
+        def callback(index: int) -> ProgressCallback:
+            async def report(event: FFmpegProgress):
+                out_times[index], speeds[index] = event.out_time, event.speed
+                await self.progress_callback(FFmpegProgress(out_time=sum(out_times), speed=sum(speeds)))
+            return report
+        return [callback(i) for i in range(count)]
+    
+    def _final_progress(self) -> Optional[ProgressCallback]:
+        """Callback for the copy steps after a split: their out_time restarts at 0, so only completion is passed on"""
+        if self.progress_callback is None:
+            return None
+        
+        async def report(event: FFmpegProgress):
+            if event.done:
+                await self.progress_callback(event)
+        return report
+    
+    def _trim_output(self, video_path: str, start: float, end: float, ext: str) -> str:
+        """Output path named after the range, so several cuts of one input never collide"""
+        base = os.path.splitext(os.path.basename(video_path))[0]
+        return os.path.join(self.workdir, f"trimmed_{base}_{round(start * 1000)}-{round(end * 1000)}{ext}")
+    
+    async def smart_trim_video(self, video_path: str, start: str, end: str,
+                               keyframes: List[float], codec: str,
+                               pix_fmt: Optional[str] = None) -> str:
+        """Frame-accurate trim that only re-encodes the partial GOPs at each edge"""
+        start_seconds = parse_time(start)
+        end_seconds = parse_time(end)
+        encoder = SMART_TRIM_ENCODERS.get(codec)
+        output = self._trim_output(video_path, start_seconds, end_seconds, ".mp4")
+        
+        inner = [k for k in keyframes if start_seconds <= k <= end_seconds]
+        # Without a whole GOP inside the range there is nothing to copy
+        if encoder is None or len(inner) < 2:
+            return await self.encode_video(
+                video_path, output, ['-c:v', 'libx264', '-preset', 'medium'],
+                start=format_time(start_seconds), end=format_time(end_seconds)
+            )
+        
+        first_key, last_key = inner[0], inner[-1]
+        tag = uuid.uuid4().hex
+        concat_file = os.path.join(self.workdir, f"concat_{tag}.txt")
+        video_only = os.path.join(self.workdir, f"video_{tag}.ts")
+        parts = []
+        
+        def part(name: str) -> str:
+            # MPEG-TS keeps SPS/PPS in-band, so re-encoded edges and copied
+            # GOPs can differ slightly in their parameter sets
+            path = os.path.join(self.workdir, f"{name}_{tag}.ts")
+            parts.append(path)
+            return path
+        
+        def encode_cmd(seg_start: float, seg_end: float, path: str) -> List[str]:
+            return [
+                self.ffmpeg,
+                '-ss', format_time(seg_start),
+                '-t', format_time(seg_end - seg_start),
+                '-i', video_path,
+                '-an',
+                '-c:v', encoder,
+                '-preset', 'medium',
+                '-pix_fmt', pix_fmt or 'yuv420p',
+                path,
+                '-y'
+            ]
+        
+        try:
+            commands = []
+            if first_key > start_seconds:
+                commands.append(encode_cmd(start_seconds, first_key, part("head")))
+            
+            commands.append([
+                self.ffmpeg,
+                '-ss', format_time(first_key),
+                '-t', format_time(last_key - first_key),
+                '-i', video_path,
+                '-an',
+                '-c:v', 'copy',
+                '-avoid_negative_ts', 'make_zero',
+                part("middle"),
+                '-y'
+            ])
+            
+            if end_seconds > last_key:
+                commands.append(encode_cmd(last_key, end_seconds, part("tail")))
+            
+            callbacks = self._split_progress(len(commands))
+            await asyncio.gather(*(self.run_command(cmd, callback) for cmd, callback in zip(commands, callbacks)))
+            
+            with open(concat_file, 'w') as f:
+                for path in parts:
+                    f.write(f"file '{os.path.abspath(path)}'\n")
+            
+            await self.run_command([
+                self.ffmpeg,
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', concat_file,
+                '-c', 'copy',
+                video_only,
+                '-y'
+            ], self._final_progress())
+            
+            # Audio frames are short, so a stream-copied cut is already accurate
+            await self.run_command([
+                self.ffmpeg,
+                '-i', video_only,
+                '-ss', format_time(start_seconds),
+                '-t', format_time(end_seconds - start_seconds),
+                '-i', video_path,
+                '-map', '0:v:0',
+                '-map', '1:a?',
+                '-c', 'copy',
+                '-shortest',
+                output,
+                '-y'
+            ], self._final_progress())
+        finally:
+            for path in parts + [concat_file, video_only]:
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        return output
+    
     async def convert_video(self, input_path: str, output_format: str, 
-                          quality: Optional[Dict] = None) -> str:
-        """Convert video format"""
+                          quality: Optional[Dict] = None, start: Optional[str] = None,
+                          end: Optional[str] = None, file_unique_id: Optional[str] = None) -> str:
+        """Convert video format, optionally trimming in the same pass"""
         base = os.path.splitext(os.path.basename(input_path))[0]
-        output = os.path.join(config.TEMP_DIR, f"{base}.{output_format}")
-        
-        cmd = [self.ffmpeg, '-i', input_path]
+        output = os.path.join(self.workdir, f"{base}.{output_format}")
+        if os.path.abspath(output) == os.path.abspath(input_path):
+            # Same format in the input's own directory; ffmpeg would overwrite what it reads
+            output = os.path.join(self.workdir, f"{base}_converted.{output_format}")
         
+        video_args = []
         if quality:
             if 'resolution' in quality:
-                cmd.extend(['-s', quality['resolution']])
+                video_args.extend(['-s', quality['resolution']])
             if 'bitrate' in quality:
-                cmd.extend(['-b:v', quality['bitrate']])
+                video_args.extend(['-b:v', quality['bitrate']])
+        video_args.extend(['-c:v', 'libx264', '-preset', 'medium'])
         
-        cmd.extend(['-c:v', 'libx264', '-preset', 'medium', output, '-y'])
+        return await self.encode_video(input_path, output, video_args, start=start, end=end,
+                                       file_unique_id=file_unique_id)
+    
+    async def encode_video(self, input_path: str, output: str, video_args: List[str],
+                           audio_args: Optional[List[str]] = None, start: Optional[str] = None,
+                           end: Optional[str] = None, segments: Optional[int] = None,
+                           file_unique_id: Optional[str] = None) -> str:
+        """Re-encode a video, splitting long inputs into segments encoded in parallel.
+
+        Pass the input's file_unique_id when it has one so its probe and
+        keyframe index are shared through the persistent media info cache.
+        """
+        audio_args = audio_args or []
+        
+        if not start and not end:
+            from utils.media_info import media_info
+            info = await media_info.probe(input_path, file_unique_id)
+            segments = segments or config.PARALLEL_SEGMENTS
+            if segments > 1 and info.duration >= config.PARALLEL_MIN_DURATION:
+                keyframes = await media_info.keyframes(input_path, file_unique_id)
+                boundaries = self._segment_boundaries(keyframes, info.duration, segments)
+                if len(boundaries) > 2:
+                    return await self._encode_segments(input_path, output, video_args, audio_args, boundaries)
+        
+        cmd = [self.ffmpeg]
+        if start:
+            cmd.extend(['-ss', start])
+        if end:
+            cmd.extend(['-to', end])
+        cmd.extend(['-i', input_path, *video_args, *audio_args, output, '-y'])
         
         await self.run_command(cmd)
         return output
     
+    @staticmethod
+    def _segment_boundaries(keyframes: List[float], duration: float, segments: int) -> List[float]:
+        """Split points snapped to keyframes, so every segment seek is cheap"""
+        boundaries = [0.0]
+        for i in range(1, segments):
+            target = duration * i / segments
+            nearest = min(keyframes, key=lambda k: abs(k - target), default=None)
+            if nearest is not None and boundaries[-1] < nearest < duration:
+                boundaries.append(nearest)
+        boundaries.append(duration)
+        return boundaries
+    
+    async def _encode_segments(self, input_path: str, output: str, video_args: List[str],
+                               audio_args: List[str], boundaries: List[float]) -> str:
+        tag = uuid.uuid4().hex
+        count = len(boundaries) - 1
+        # Every scheduler worker may be running a split encode at the same time
+        threads = max(1, (os.cpu_count() or 1) // (count * scheduler.workers))
+        concat_file = os.path.join(self.workdir, f"concat_{tag}.txt")
+        parts = [os.path.join(self.workdir, f"segment_{tag}_{i}.ts") for i in range(count)]
+        
+        def segment_cmd(i: int) -> List[str]:
+            return [
+                self.ffmpeg,
+                '-ss', format_time(boundaries[i]),
+                '-t', format_time(boundaries[i + 1] - boundaries[i]),
+                '-i', input_path,
+                '-an',
+                *video_args,
+                '-threads', str(threads),
+                parts[i],
+                '-y'
+            ]
+        
+        try:
+            callbacks = self._split_progress(count)
+            await asyncio.gather(*(self.run_command(segment_cmd(i), callbacks[i]) for i in range(count)))
+            
+            with open(concat_file, 'w') as f:
+                for path in parts:
+                    f.write(f"file '{os.path.abspath(path)}'\n")
+            
+            # Audio is cheap to encode, so it is done once while muxing
+            await self.run_command([
+                self.ffmpeg,
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', concat_file,
+                '-i', input_path,
+                '-map', '0:v:0',
+                '-map', '1:a?',
+                '-c:v', 'copy',
+                *audio_args,
+                output,
+                '-y'
+            ], self._final_progress())
+        finally:
+            for path in parts + [concat_file]:
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        return output
+    
     async def merge_videos(self, video_paths: List[str]) -> str:
         """Merge multiple videos"""
-        output = os.path.join(config.TEMP_DIR, "merged.mp4")
+        tag = uuid.uuid4().hex
+        output = os.path.join(self.workdir, f"merged_{tag}.mp4")
         
         # Create concat file
-        concat_file = os.path.join(config.TEMP_DIR, "concat.txt")
+        concat_file = os.path.join(self.workdir, f"concat_{tag}.txt")
         with open(concat_file, 'w') as f:
             for path in video_paths:
                 f.write(f"file '{os.path.abspath(path)}'\n")
@@ -146,39 +538,33 @@ class FFmpegHandler:
             '-y'
         ]
         
-        await self.run_command(cmd)
-        os.remove(concat_file)
+        try:
+            await self.run_command(cmd)
+        finally:
+            os.remove(concat_file)
         return output
     
-    async def compress_video(self, video_path: str, target_size_mb: int) -> str:
+    async def compress_video(self, video_path: str, target_size_mb: int,
+                             file_unique_id: Optional[str] = None) -> str:
         """Compress video"""
-        output = os.path.join(config.TEMP_DIR, f"compressed_{os.path.basename(video_path)}")
+        output = os.path.join(self.workdir, f"compressed_{os.path.basename(video_path)}")
         
         # Get duration
-        info = await self.get_media_info(video_path)
-        duration = float(info['format']['duration'])
+        from utils.media_info import media_info
+        info = await media_info.probe(video_path, file_unique_id)
+        duration = info.duration
         
         # Calculate bitrate
         target_bitrate = int((target_size_mb * 8192) / duration)
         
-        cmd = [
-            self.ffmpeg,
-            '-i', video_path,
-            '-c:v', 'libx264',
-            '-b:v', f'{target_bitrate}k',
-            '-preset', 'medium',
-            output,
-            '-y'
-        ]
-        
-        await self.run_command(cmd)
-        return output
+        video_args = ['-c:v', 'libx264', '-b:v', f'{target_bitrate}k', '-preset', 'medium']
+        return await self.encode_video(video_path, output, video_args, file_unique_id=file_unique_id)
     
     async def convert_audio(self, audio_path: str, output_format: str, 
                           bitrate: str = "192k") -> str:
         """Convert audio format"""
         base = os.path.splitext(os.path.basename(audio_path))[0]
-        output = os.path.join(config.TEMP_DIR, f"{base}.{output_format}")
+        output = os.path.join(self.workdir, f"{base}.{output_format}")
         
         cmd = [
             self.ffmpeg,
@@ -193,10 +579,11 @@ class FFmpegHandler:
     
     async def merge_audio(self, audio_paths: List[str]) -> str:
         """Merge multiple audio files"""
-        output = os.path.join(config.TEMP_DIR, "merged_audio.mp3")
+        tag = uuid.uuid4().hex
+        output = os.path.join(self.workdir, f"merged_audio_{tag}.mp3")
         
         # Create concat file
-        concat_file = os.path.join(config.TEMP_DIR, "audio_concat.txt")
+        concat_file = os.path.join(self.workdir, f"audio_concat_{tag}.txt")
         with open(concat_file, 'w') as f:
             for path in audio_paths:
                 f.write(f"file '{os.path.abspath(path)}'\n")
@@ -211,14 +598,16 @@ class FFmpegHandler:
             '-y'
         ]
         
-        await self.run_command(cmd)
-        os.remove(concat_file)
+        try:
+            await self.run_command(cmd)
+        finally:
+            os.remove(concat_file)
         return output
     
     async def adjust_audio(self, audio_path: str, speed: float = 1.0, 
                          volume: float = 1.0) -> str:
         """Adjust audio speed and volume"""
-        output = os.path.join(config.TEMP_DIR, f"adjusted_{os.path.basename(audio_path)}")
+        output = os.path.join(self.workdir, f"adjusted_{os.path.basename(audio_path)}")
         
         filters = []
         if speed != 1.0:
@@ -237,7 +626,7 @@ class FFmpegHandler:
     async def create_gif(self, video_path: str, start: str, duration: str, 
                         fps: int = 10, width: int = 480) -> str:
         """Create GIF from video"""
-        output = os.path.join(config.TEMP_DIR, f"gif_{os.path.basename(video_path)}.gif")
+        output = os.path.join(self.workdir, f"gif_{os.path.basename(video_path)}.gif")
         
         cmd = [
             self.ffmpeg,
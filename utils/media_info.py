@@ -0,0 +1,115 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import List, Optional
+from config import config
+from database.models import MediaInfo
+from database.operations import DatabaseOperations
+from utils.ffmpeg_utils import FFmpegHandler
+
+logger = logging.getLogger(__name__)
+
+class MediaInfoCache:
+    """Memoized ffprobe results.
+
+    Lookups go through an in-process LRU first. Files identified by a Telegram
+    file_unique_id are also persisted in the media_info collection so other
+    processes and restarts skip the probe; path-keyed entries stay local since
+    paths mean nothing on another host.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or config.MEDIA_INFO_CACHE_SIZE
+        self._entries: "OrderedDict[str, MediaInfo]" = OrderedDict()
+        self._keyframes: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    @staticmethod
+    def file_key(path: str) -> str:
+        """Identity of a local file that changes whenever its content may have"""
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    async def probe(self, path: str, file_unique_id: Optional[str] = None) -> MediaInfo:
+        """Parsed media info for a file, running ffprobe only on a cache miss"""
+        key = file_unique_id or self.file_key(path)
+
+        info = await self._lookup(key, persistent=bool(file_unique_id))
+        if info is None:
+            raw = await FFmpegHandler().get_media_info(path)
+            info = await self._store(MediaInfo.from_ffprobe(key, raw), persistent=bool(file_unique_id))
+        return info
+
+    async def probe_remote(self, bot, file_id: str, file_unique_id: str) -> MediaInfo:
+        """Media info for a Telegram file without downloading it.
+
+        ffprobe is pointed at the Bot API file URL (or the local path when a
+        local Bot API server is used) with a small probe size, so it only reads
+        the container header and seeks with range requests to find e.g. a
+        trailing moov atom.
+        """
+        info = await self._lookup(file_unique_id, persistent=True)
+        if info is None:
+            file = await bot.get_file(file_id)
+            raw = await FFmpegHandler().get_media_info(file.file_path, probe_size=config.PROBE_HEADER_SIZE)
+            info = await self._store(MediaInfo.from_ffprobe(file_unique_id, raw), persistent=True)
+        return info
+
+    async def keyframes(self, path: str, file_unique_id: Optional[str] = None) -> List[float]:
+        """Keyframe index of a file, built once and cached like the probe results"""
+        key = file_unique_id or self.file_key(path)
+
+        keyframes = self._keyframes.get(key)
+        if keyframes is not None:
+            self._keyframes.move_to_end(key)
+            return keyframes
+
+        if file_unique_id:
+            try:
+                keyframes = await DatabaseOperations.get_keyframes(key)
+            except Exception as e:
+                logger.warning(f"Keyframe lookup failed for {key}: {e}")
+
+        if keyframes is None:
+            keyframes = await FFmpegHandler().get_keyframes(path)
+            if file_unique_id:
+                try:
+                    await DatabaseOperations.save_keyframes(key, keyframes)
+                except Exception as e:
+                    logger.warning(f"Could not persist keyframes for {key}: {e}")
+
+        self._remember(self._keyframes, key, keyframes)
+        return keyframes
+
+    async def _lookup(self, key: str, persistent: bool) -> Optional[MediaInfo]:
+        info = self._entries.get(key)
+        if info is not None:
+            self._entries.move_to_end(key)
+            return info
+
+        if persistent:
+            try:
+                data = await DatabaseOperations.get_media_info(key)
+                if data:
+                    info = MediaInfo(**data)
+                    self._remember(self._entries, key, info)
+            except Exception as e:
+                logger.warning(f"Media info lookup failed for {key}: {e}")
+        return info
+
+    async def _store(self, info: MediaInfo, persistent: bool) -> MediaInfo:
+        if persistent:
+            try:
+                await DatabaseOperations.save_media_info(info.dict())
+            except Exception as e:
+                logger.warning(f"Could not persist media info for {info.key}: {e}")
+        self._remember(self._entries, info.key, info)
+        return info
+
+    def _remember(self, entries: OrderedDict, key: str, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+# Singleton instance
+media_info = MediaInfoCache()
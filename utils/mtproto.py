@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Optional
+from config import config
+from utils.rate_limiter import LANE_UPLOAD, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+class MTProtoUploader:
+    """Optional upload path for large results through pyrogram.
+
+    The Bot API takes an upload as one sequential multipart POST. Over MTProto
+    pyrogram splits a file into 512 KB parts and spreads a large file's parts
+    over several sessions; MTPROTO_CONNECTIONS caps how many uploads are
+    transmitted at once. Messages it returns carry the same file_id format as
+    the Bot API, so results stay reusable through send_cached.
+
+    Enabled only when MTPROTO_API_ID and MTPROTO_API_HASH are set. pyrogram
+    is imported on first use, so deployments without it never load it. If the
+    client is rejected (bad credentials) MTProto is disabled; any other start
+    failure sends uploads to the Bot API for MTPROTO_RETRY_INTERVAL.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = asyncio.Lock()
+        self._unavailable = False
+        self._retry_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            bool(config.MTPROTO_API_ID and config.MTPROTO_API_HASH)
+            and not self._unavailable
+            and time.monotonic() >= self._retry_at
+        )
+
+    def should_use(self, file_path: str) -> bool:
+        """Whether a file is large enough to be worth the MTProto path"""
+        return self.should_use_size(os.path.getsize(file_path))
+
+    def should_use_size(self, size: int) -> bool:
+        return self.enabled and size >= config.MTPROTO_UPLOAD_THRESHOLD
+
+    async def _get_client(self):
+        async with self._lock:
+            if self._client is None:
+                # Uploads that waited on the lock behind a failed start fall back too
+                if not self.enabled:
+                    raise RuntimeError("MTProto uploads are unavailable")
+                try:
+                    from pyrogram import Client
+                    from pyrogram.errors import BadRequest, Unauthorized
+                except ImportError:
+                    logger.warning("pyrogram is not installed, large uploads use the Bot API")
+                    self._unavailable = True
+                    raise
+
+                client = Client(
+                    "mediabot",
+                    api_id=config.MTPROTO_API_ID,
+                    api_hash=config.MTPROTO_API_HASH,
+                    bot_token=config.BOT_TOKEN,
+                    in_memory=True,
+                    no_updates=True,
+                    max_concurrent_transmissions=config.MTPROTO_CONNECTIONS
+                )
+                try:
+                    await client.start()
+                except (BadRequest, Unauthorized) as e:
+                    # Invalid api_id/hash or bot token; retrying won't help
+                    logger.error(f"MTProto client rejected, large uploads use the Bot API: {e}")
+                    self._unavailable = True
+                    raise
+                except Exception as e:
+                    logger.warning(
+                        f"MTProto client failed to start, retrying in {config.MTPROTO_RETRY_INTERVAL:.0f}s: {e}"
+                    )
+                    self._retry_at = time.monotonic() + config.MTPROTO_RETRY_INTERVAL
+                    raise
+                self._client = client
+                logger.info("MTProto upload client started")
+            return self._client
+
+    async def send(self, chat_id: int, file_type: str, file_path: str, caption: str = "", **kwargs: Any):
+        """Upload and send a file; returns a pyrogram Message"""
+        client = await self._get_client()
+        # Same chat budget as Bot API sends, which share the flood limits
+        await rate_limiter.acquire(chat_id, LANE_UPLOAD)
+        if file_type == "video":
+            return await client.send_video(chat_id, file_path, caption=caption, **kwargs)
+        if file_type == "audio":
+            return await client.send_audio(chat_id, file_path, caption=caption, **kwargs)
+        return await client.send_document(chat_id, file_path, caption=caption, **kwargs)
+
+    async def stop(self):
+        if self._client is not None:
+            try:
+                await self._client.stop()
+            except Exception as e:
+                logger.warning(f"MTProto client stop failed: {e}")
+            self._client = None
+
+# Singleton instance
+mtproto = MTProtoUploader()
+
+async def send_file(bot, chat_id: int, file_type: str, file_path: str, caption: str = "",
+                    supports_streaming: Optional[bool] = None):
+    """Send a local file as video/audio/document, over MTProto when it is large.
+
+    Either backend's message exposes `.video/.audio/.document.file_id`.
+    """
+    if mtproto.should_use(file_path):
+        try:
+            kwargs = {"supports_streaming": supports_streaming} if file_type == "video" and supports_streaming else {}
+            return await mtproto.send(chat_id, file_type, file_path, caption, **kwargs)
+        except Exception as e:
+            logger.warning(f"MTProto upload failed, falling back to Bot API: {e}")
+
+    with open(file_path, 'rb') as f:
+        if file_type == "video":
+            return await bot.send_video(
+                chat_id=chat_id,
+                video=f,
+                caption=caption,
+                supports_streaming=supports_streaming
+            )
+        if file_type == "audio":
+            return await bot.send_audio(chat_id=chat_id, audio=f, caption=caption)
+        return await bot.send_document(chat_id=chat_id, document=f, caption=caption)
@@ -0,0 +1,228 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config import config
+from utils.ffmpeg_utils import FFmpegHandler, ProgressCallback
+
+# Audio effect filters, parameterised by intensity
+AUDIO_EFFECTS: Dict[str, Callable[[float], str]] = {
+    "8d": lambda intensity: "apulsator=hz=0.08",
+    "reverb": lambda intensity: f"aecho=0.8:0.9:{int(1000*intensity)}:{int(500*intensity)}",
+    "chorus": lambda intensity: f"chorus=0.7:0.9:55:0.4:0.25:{intensity}",
+    "flanger": lambda intensity: "flanger=delay=0:depth=2:regen=0:width=71:speed=0.5:shape=sin:phase=25",
+    "phaser": lambda intensity: "aphaser=in_gain=0.4:out_gain=0.74:delay=3:decay=0.4:speed=0.5:type=t"
+}
+
+# Encoder and whether it takes a bitrate, per output format
+AUDIO_ENCODERS: Dict[str, Tuple[str, bool]] = {
+    "mp3": ("libmp3lame", True),
+    "aac": ("aac", True),
+    "m4a": ("aac", True),
+    "opus": ("libopus", True),
+    "ogg": ("libvorbis", True),
+    "wma": ("wmav2", True),
+    "ac3": ("ac3", True),
+    "flac": ("flac", False),
+    "wav": ("pcm_s16le", False)
+}
+
+# Encoders that only accept some sample rates; requested rates snap to these
+ENCODER_SAMPLE_RATES: Dict[str, Tuple[int, ...]] = {
+    "libopus": (8000, 12000, 16000, 24000, 48000)
+}
+
+def atempo_chain(speed: float) -> List[str]:
+    """atempo only accepts 0.5-2.0, so larger changes are chained"""
+    if speed <= 0:
+        raise ValueError(f"Speed must be positive, got {speed}")
+    filters = []
+    while speed > 2.0:
+        filters.append("atempo=2.0")
+        speed /= 2.0
+    while speed < 0.5:
+        filters.append("atempo=0.5")
+        speed /= 0.5
+    if speed != 1.0:
+        filters.append(f"atempo={speed:g}")
+    return filters
+
+class AudioPipeline:
+    """Compiles a chain of audio edits into one filtergraph and one encode.
+
+    Steps always apply in the order trim → effects → speed/volume → pitch →
+    encode, whatever order they were added in, so the result does not depend
+    on how a handler assembled the chain.
+    """
+
+    def __init__(self):
+        self._start: Optional[str] = None
+        self._end: Optional[str] = None
+        self._effects: List[Tuple[str, float]] = []
+        self._speed = 1.0
+        self._volume = 1.0
+        self._pitch = 1.0
+        self._sample_rate = 44100
+        self._resample = False
+        self._channels: Optional[int] = None
+        self._format = "mp3"
+        self._bitrate = config.DEFAULT_AUDIO_BITRATE
+
+    @classmethod
+    def from_settings(cls, settings) -> "AudioPipeline":
+        """Start a chain from a user's UserSettings"""
+        return cls() \
+            .speed(settings.audio_speed) \
+            .volume(settings.audio_volume / 100) \
+            .encode("mp3", settings.audio_bitrate, int(settings.audio_sample_rate), settings.audio_channels)
+
+    def trim(self, start: Optional[str] = None, end: Optional[str] = None) -> "AudioPipeline":
+        self._start, self._end = start, end
+        return self
+
+    def effect(self, name: str, intensity: float = 1.0) -> "AudioPipeline":
+        if name not in AUDIO_EFFECTS:
+            raise ValueError(f"Unknown effect: {name}")
+        self._effects.append((name, intensity))
+        return self
+
+    def speed(self, speed: float) -> "AudioPipeline":
+        if speed <= 0:
+            raise ValueError(f"Speed must be positive, got {speed}")
+        self._speed = speed
+        return self
+
+    def volume(self, volume: float) -> "AudioPipeline":
+        self._volume = volume
+        return self
+
+    def pitch(self, pitch: float) -> "AudioPipeline":
+        self._pitch = pitch
+        return self
+
+    def encode(self, format: str = "mp3", bitrate: Optional[str] = None,
+               sample_rate: Optional[int] = None, channels: Optional[int] = None) -> "AudioPipeline":
+        """Set the output; pass sample_rate only to resample, the source rate is kept otherwise"""
+        if format not in AUDIO_ENCODERS:
+            raise ValueError(f"Unsupported audio format: {format}")
+        self._format = format
+        self._bitrate = bitrate or self._bitrate
+        if sample_rate:
+            self._sample_rate = sample_rate
+            self._resample = True
+        self._channels = channels
+        return self
+
+    @property
+    def format(self) -> str:
+        return self._format
+
+    def filters(self) -> List[str]:
+        """The fused filtergraph"""
+        filters = [AUDIO_EFFECTS[name](intensity) for name, intensity in self._effects]
+        filters.extend(atempo_chain(self._speed))
+        if self._volume != 1.0:
+            filters.append(f"volume={self._volume:g}")
+        if self._pitch != 1.0:
+            filters.append(f"asetrate={self._sample_rate}*{self._pitch:g}")
+            filters.append(f"aresample={self._sample_rate}")
+        return filters
+
+    def params(self) -> Dict[str, Any]:
+        """Canonical description of the chain, e.g. for result cache keys"""
+        return {
+            "trim": [self._start, self._end],
+            "effects": self._effects,
+            "speed": self._speed,
+            "volume": self._volume,
+            "pitch": self._pitch,
+            "format": self._format,
+            "bitrate": self._bitrate,
+            "sample_rate": self._sample_rate,
+            "channels": self._channels
+        }
+
+    def compile(self, input_path: str, output_path: str) -> List[str]:
+        """Build the single FFmpeg command for the whole chain"""
+        cmd = [config.FFMPEG_PATH]
+        if self._start:
+            cmd.extend(['-ss', self._start])
+        if self._end:
+            cmd.extend(['-to', self._end])
+        cmd.extend(['-i', input_path, '-vn'])
+
+        filters = self.filters()
+        if filters:
+            cmd.extend(['-af', ','.join(filters)])
+
+        codec, uses_bitrate = AUDIO_ENCODERS[self._format]
+        cmd.extend(['-c:a', codec])
+        if uses_bitrate:
+            cmd.extend(['-b:a', self._bitrate])
+        if self._resample:
+            cmd.extend(['-ar', str(self._output_rate(codec))])
+        if self._channels:
+            cmd.extend(['-ac', str(self._channels)])
+
+        cmd.extend([output_path, '-y'])
+        return cmd
+
+    def _output_rate(self, codec: str) -> int:
+        """The requested rate, or the nearest one at or above it the encoder accepts"""
+        rates = ENCODER_SAMPLE_RATES.get(codec)
+        if not rates or self._sample_rate in rates:
+            return self._sample_rate
+        return next((rate for rate in rates if rate >= self._sample_rate), rates[-1])
+
+    async def run(self, input_path: str, prefix: str = "processed",
+                  workdir: Optional[str] = None) -> str:
+        """Run the chain and return the output path"""
+        base = os.path.splitext(os.path.basename(input_path))[0]
+        output = os.path.join(workdir or config.TEMP_DIR, f"{prefix}_{base}.{self._format}")
+
+        ffmpeg = FFmpegHandler(workdir=workdir)
+        await ffmpeg.run_command(self.compile(input_path, output))
+        return output
+
+class VideoPipeline:
+    """Trim, scale and convert a video in a single convert_video pass"""
+
+    def __init__(self):
+        self._start: Optional[str] = None
+        self._end: Optional[str] = None
+        self._quality: Dict[str, str] = {}
+        self._format = "mp4"
+
+    def trim(self, start: Optional[str] = None, end: Optional[str] = None) -> "VideoPipeline":
+        self._start, self._end = start, end
+        return self
+
+    def scale(self, resolution: str) -> "VideoPipeline":
+        self._quality["resolution"] = resolution
+        return self
+
+    def bitrate(self, bitrate: str) -> "VideoPipeline":
+        self._quality["bitrate"] = bitrate
+        return self
+
+    def quality(self, quality: Dict[str, str]) -> "VideoPipeline":
+        self._quality.update(quality)
+        return self
+
+    def encode(self, format: str = "mp4") -> "VideoPipeline":
+        self._format = format
+        return self
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            "trim": [self._start, self._end],
+            "quality": self._quality,
+            "format": self._format
+        }
+
+    async def run(self, input_path: str, workdir: Optional[str] = None,
+                  file_unique_id: Optional[str] = None,
+                  on_progress: Optional[ProgressCallback] = None) -> str:
+        ffmpeg = FFmpegHandler(on_progress, workdir=workdir)
+        return await ffmpeg.convert_video(
+            input_path, self._format, self._quality or None,
+            start=self._start, end=self._end, file_unique_id=file_unique_id
+        )
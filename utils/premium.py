@@ -1,5 +1,28 @@
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from telegram import Update
+from telegram.ext import ContextTypes
 from config import config
 from database.operations import DatabaseOperations
+from utils.admission import admission
+
+# Tiers already resolved while handling the current update
+_update_tiers: ContextVar[Optional[Dict[int, bool]]] = ContextVar("update_tiers", default=None)
+
+# user_id -> (premium, expires at)
+_tier_cache: Dict[int, Tuple[bool, float]] = {}
+
+async def begin_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Give each update its own tier memo (registered in handler group -1)"""
+    _update_tiers.set({})
+
+def invalidate_tier(user_id: int):
+    """Forget a user's cached tier, e.g. after it was changed"""
+    _tier_cache.pop(user_id, None)
+    memo = _update_tiers.get()
+    if memo is not None:
+        memo.pop(user_id, None)
 
 async def is_premium_user(user_id: int) -> bool:
     """Check if user is premium"""
@@ -7,37 +30,36 @@ async def is_premium_user(user_id: int) -> bool:
     if user_id in config.PREMIUM_USER_IDS:
         return True
     
-    # Check database
-    user = await DatabaseOperations.get_user(user_id)
-    if user and user.get('tier') == 'premium':
-        return True
+    memo = _update_tiers.get()
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+    
+    now = time.monotonic()
+    cached = _tier_cache.get(user_id)
+    if cached and cached[1] > now:
+        premium = cached[0]
+    else:
+        # Check database
+        user = await DatabaseOperations.get_user(user_id)
+        premium = bool(user and user.get('tier') == 'premium')
+        if len(_tier_cache) >= config.PREMIUM_CACHE_SIZE:
+            for uid in [uid for uid, (_, expires) in _tier_cache.items() if expires <= now]:
+                del _tier_cache[uid]
+            if len(_tier_cache) >= config.PREMIUM_CACHE_SIZE:
+                _tier_cache.pop(next(iter(_tier_cache)))
+        _tier_cache[user_id] = (premium, now + config.PREMIUM_CACHE_TTL)
     
-    return False
+    if memo is not None:
+        memo[user_id] = premium
+    return premium
 
 async def check_wait_time(user_id: int) -> tuple[bool, str]:
     """Check wait time for free users"""
     if await is_premium_user(user_id):
         return True, ""
     
-    from datetime import datetime, timedelta
-    from database.connection import get_database
-    
-    db = await get_database()
-    
-    # Get last completed job
-    last_job = await db.jobs.find_one(
-        {"user_id": user_id, "status": "completed"},
-        sort=[("end_time", -1)]
-    )
-    
-    if not last_job or not last_job.get("end_time"):
-        return True, ""
-    
-    wait_until = last_job["end_time"] + timedelta(seconds=config.FREE_USER_WAIT_TIME)
-    now = datetime.utcnow()
-    
-    if now < wait_until:
-        wait_seconds = int((wait_until - now).total_seconds())
+    wait_seconds = int(admission.wait_left(user_id))
+    if wait_seconds > 0:
         minutes = wait_seconds // 60
         seconds = wait_seconds % 60
         return False, f"⏳ Please wait {minutes}m {seconds}s before next file"
@@ -1,127 +1,166 @@
 import asyncio
-from typing import Callable
+import logging
+import time
+from typing import Callable, Dict, Tuple
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
+from config import config
+from utils.downloader import downloader
+from utils.mtproto import send_file
+
+logger = logging.getLogger(__name__)
 
 class ProgressHandler:
     def __init__(self):
+        self.bot = None
         self.progress_bars = {}
-    
+        # Per-message edit state: last text sent, when, and the newest pending text
+        self._sent: Dict[Tuple[int, int], Tuple[str, float]] = {}
+        self._pending: Dict[Tuple[int, int], str] = {}
+        self._flushes: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    def bind(self, bot):
+        """Use the application's bot (and its connection pool) for all progress messages"""
+        self.bot = bot
+
+    async def edit(self, chat_id: int, message_id: int, text: str, final: bool = False):
+        """Edit a progress message, coalescing rapid updates.
+
+        Unchanged text is skipped, and edits closer together than
+        PROGRESS_EDIT_INTERVAL are folded into one delayed edit carrying the
+        latest text. `final` bypasses the interval so the last state always lands.
+        """
+        key = (chat_id, message_id)
+        last_text, last_time = self._sent.get(key, (None, 0.0))
+
+        if text == last_text:
+            self._pending.pop(key, None)
+            return
+
+        wait = last_time + config.PROGRESS_EDIT_INTERVAL - time.monotonic()
+        if final or wait <= 0:
+            self._pending.pop(key, None)
+            await self._send_edit(key, text)
+            return
+
+        self._pending[key] = text
+        if key not in self._flushes:
+            self._flushes[key] = asyncio.create_task(self._flush_later(key, wait))
+
+    def forget(self, chat_id: int, message_id: int):
+        """Drop edit state for a message that is finished or deleted"""
+        key = (chat_id, message_id)
+        self._sent.pop(key, None)
+        self._pending.pop(key, None)
+        task = self._flushes.pop(key, None)
+        if task:
+            task.cancel()
+
+    async def _flush_later(self, key: Tuple[int, int], delay: float):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._flushes.pop(key, None)
+        text = self._pending.pop(key, None)
+        if text is not None and text != self._sent.get(key, (None, 0.0))[0]:
+            await self._send_edit(key, text)
+
+    async def _send_edit(self, key: Tuple[int, int], text: str):
+        chat_id, message_id = key
+        # Record first so concurrent callers coalesce against this edit
+        self._sent[key] = (text, time.monotonic())
+        try:
+            await self.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text)
+        except BadRequest as e:
+            # "Message is not modified" and deleted messages are expected here
+            logger.debug(f"Progress edit skipped: {e}")
+        except Exception as e:
+            logger.warning(f"Progress edit failed: {e}")
+
     async def create_progress_bar(self, chat_id: int, total: int, description: str = "Processing"):
         """Create a progress bar message"""
-        from telegram import Bot
-        from config import config
-        
-        bot = Bot(config.BOT_TOKEN)
-        
-        message = await bot.send_message(
-            chat_id=chat_id,
-            text=f"{description}\n{self._get_bar(0)} 0%"
-        )
-        
+        text = f"{description}\n{self._get_bar(0)} 0%"
+        message = await self.bot.send_message(chat_id=chat_id, text=text)
+
         self.progress_bars[chat_id] = {
             'message_id': message.message_id,
             'total': total,
             'current': 0,
             'description': description
         }
-        
+        self._sent[(chat_id, message.message_id)] = (text, time.monotonic())
+
         return message.message_id
-    
+
     def _get_bar(self, percentage: int) -> str:
         """Get progress bar string"""
         bar_length = 20
         filled = int(bar_length * percentage / 100)
         bar = '█' * filled + '░' * (bar_length - filled)
         return f"[{bar}]"
-    
+
     async def update_progress(self, chat_id: int, current: int):
         """Update progress bar"""
         if chat_id not in self.progress_bars:
             return
-        
+
         data = self.progress_bars[chat_id]
         total = data['total']
-        percentage = int((current / total) * 100)
-        
-        if percentage > 100:
-            percentage = 100
-        
-        # Only update every 5% to avoid spam
-        if percentage % 5 != 0 and percentage != 100:
-            return
-        
-        from telegram import Bot
-        from config import config
-        
-        bot = Bot(config.BOT_TOKEN)
-        
-        try:
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=data['message_id'],
-                text=f"{data['description']}\n{self._get_bar(percentage)} {percentage}%"
-            )
-        except:
-            pass
-        
+        percentage = min(int((current / total) * 100), 100) if total else 100
+        data['current'] = current
+
+        await self.edit(
+            chat_id,
+            data['message_id'],
+            f"{data['description']}\n{self._get_bar(percentage)} {percentage}%",
+            final=percentage == 100
+        )
+
         if percentage == 100:
+            self.forget(chat_id, data['message_id'])
             del self.progress_bars[chat_id]
-    
-    async def download_with_progress(self, bot, file_id: str, file_path: str, 
+
+    def ffmpeg_callback(self, chat_id: int, message_id: int, description: str,
+                        duration: float) -> Callable:
+        """Progress callback for FFmpegHandler that renders into an existing message"""
+        async def report(event):
+            percentage = 100 if event.done else min(int(event.out_time / duration * 100), 99) if duration else 0
+            await self.edit(
+                chat_id,
+                message_id,
+                f"{description}\n{self._get_bar(percentage)} {percentage}% ({event.speed:.1f}x)",
+                final=event.done
+            )
+        return report
+
+    async def download_with_progress(self, bot, file_id: str, file_path: str,
                                    chat_id: int, description: str = "Downloading"):
         """Download file with progress"""
         file = await bot.get_file(file_id)
-        file_size = file.file_size
-        
-        # Create progress bar
-        await self.create_progress_bar(chat_id, file_size, description)
-        
-        # Download in chunks
-        chunk_size = 1024 * 1024  # 1MB chunks
-        downloaded = 0
-        
-        with open(file_path, 'wb') as f:
-            async for chunk in file.download_as_bytearray():
-                f.write(chunk)
-                downloaded += len(chunk)
-                await self.update_progress(chat_id, downloaded)
-        
-        return file_path
-    
-    async def upload_with_progress(self, bot, chat_id: int, file_path: str, 
+        await self.create_progress_bar(chat_id, file.file_size, description)
+
+        # Streamed to disk chunk by chunk; update_progress coalesces the edits
+        async def report(downloaded: int, total: int):
+            await self.update_progress(chat_id, downloaded)
+
+        return await downloader.download_file(file, file_path, on_progress=report)
+
+    async def upload_with_progress(self, bot, chat_id: int, file_path: str,
                                  caption: str = "", file_type: str = "document"):
         """Upload file with progress"""
         import os
-        
+
         file_size = os.path.getsize(file_path)
         await self.create_progress_bar(chat_id, file_size, "Uploading")
-        
-        # Upload file
-        with open(file_path, 'rb') as f:
-            if file_type == "video":
-                await bot.send_video(
-                    chat_id=chat_id,
-                    video=f,
-                    caption=caption,
-                    supports_streaming=True
-                )
-            elif file_type == "audio":
-                await bot.send_audio(
-                    chat_id=chat_id,
-                    audio=f,
-                    caption=caption
-                )
-            else:
-                await bot.send_document(
-                    chat_id=chat_id,
-                    document=f,
-                    caption=caption
-                )
-        
+
+        # Large files go over MTProto when it is configured
+        await send_file(bot, chat_id, file_type, file_path, caption, supports_streaming=True)
+
         # Remove progress bar
         if chat_id in self.progress_bars:
             data = self.progress_bars[chat_id]
+            self.forget(chat_id, data['message_id'])
             await bot.delete_message(chat_id=chat_id, message_id=data['message_id'])
             del self.progress_bars[chat_id]
 
@@ -0,0 +1,162 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Lanes, highest priority first
+LANE_UPLOAD = 0
+LANE_REPLY = 1
+LANE_PROGRESS = 2
+
+UPLOAD_ENDPOINTS = {
+    "sendVideo", "sendAudio", "sendDocument", "sendPhoto", "sendVoice",
+    "sendAnimation", "sendVideoNote", "sendMediaGroup", "sendSticker"
+}
+PROGRESS_ENDPOINTS = {"editMessageText", "editMessageCaption", "editMessageReplyMarkup"}
+
+class TokenBucket:
+    """Classic token bucket that can additionally be paused after a flood wait"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token can be taken"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+class TelegramRateLimiter(BaseRateLimiter[int]):
+    """Token buckets in front of every Bot API call, plugged into ExtBot.
+
+    Message-producing requests take a token from the global bucket and from
+    their chat's bucket (private chats and groups have different limits).
+    When requests are waiting, the highest lane whose chat is ready goes
+    first, so result uploads overtake replies and replies overtake progress
+    edits. A 429 pauses the bucket it came from for retry_after and the
+    request is retried instead of failing the handler. Requests without a
+    chat (getFile, answerCallbackQuery, ...) are not throttled.
+    """
+
+    PRUNE_THRESHOLD = 1000
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(config.RATE_LIMIT_GLOBAL, config.RATE_LIMIT_GLOBAL)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._waiting: List[Tuple[int, int, Union[int, str]]] = []
+        self._tickets = itertools.count()
+        self._changed = asyncio.Condition()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.PRUNE_THRESHOLD:
+                now = time.monotonic()
+                for key in [key for key, b in self._chats.items() if b.idle(now)]:
+                    del self._chats[key]
+            # Negative ids (and @channel usernames) are groups/channels
+            if isinstance(chat_id, str) or chat_id < 0:
+                rate = config.RATE_LIMIT_PER_GROUP / 60
+            else:
+                rate = config.RATE_LIMIT_PER_CHAT
+            bucket = self._chats[chat_id] = TokenBucket(rate, config.RATE_LIMIT_CHAT_BURST)
+        return bucket
+
+    @staticmethod
+    def lane(endpoint: str) -> int:
+        if endpoint in UPLOAD_ENDPOINTS:
+            return LANE_UPLOAD
+        if endpoint in PROGRESS_ENDPOINTS:
+            return LANE_PROGRESS
+        return LANE_REPLY
+
+    async def acquire(self, chat_id: Union[int, str], lane: int):
+        """Wait for a global and a per-chat token, honouring lane priority"""
+        waiter = (lane, next(self._tickets), chat_id)
+        async with self._changed:
+            self._waiting.append(waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    # Earliest waiter in the best lane among those whose chat is ready
+                    ready = [w for w in self._waiting if self._chat_bucket(w[2]).delay(now) <= 0]
+                    global_delay = self.global_bucket.delay(now)
+
+                    if ready and min(ready) == waiter and global_delay <= 0:
+                        self.global_bucket.take(now)
+                        self._chat_bucket(chat_id).take(now)
+                        return
+
+                    timeout = max(global_delay, self._chat_bucket(chat_id).delay(now), 0.01)
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiting.remove(waiter)
+                self._changed.notify_all()
+
+    def pause(self, chat_id: Optional[Union[int, str]], seconds: float):
+        """Stop sending to a chat (or to everyone) after a flood wait"""
+        bucket = self._chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+        bucket.pause(seconds)
+        logger.warning(f"Flood wait: pausing {chat_id or 'all chats'} for {seconds}s")
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        lane = rate_limit_args if rate_limit_args is not None else self.lane(endpoint)
+
+        for attempt in range(config.RATE_LIMIT_MAX_RETRIES + 1):
+            if chat_id is not None:
+                await self.acquire(chat_id, lane)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == config.RATE_LIMIT_MAX_RETRIES:
+                    raise
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                self.pause(chat_id, delay + 0.1)
+                if chat_id is None:
+                    await asyncio.sleep(delay + 0.1)
+
+# Singleton instance
+rate_limiter = TelegramRateLimiter()
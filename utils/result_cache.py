@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+from typing import Dict, Any, Optional
+from telegram.error import BadRequest
+from database.operations import DatabaseOperations
+
+logger = logging.getLogger(__name__)
+
+def result_key(file_unique_id: str, operation: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Canonical hash of an input file, an operation and its parameters"""
+    canonical = json.dumps(
+        {"input": file_unique_id, "operation": operation, "params": params or {}},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class ResultCache:
+    """Maps processed outputs to the Telegram file_id they were uploaded as.
+
+    A hit is answered by resending that file_id, which skips download, FFmpeg
+    and upload entirely.
+    """
+
+    SENDERS = {
+        "photo": "send_photo",
+        "audio": "send_audio",
+        "video": "send_video",
+        "document": "send_document"
+    }
+
+    async def send_cached(self, bot, chat_id: int, file_unique_id: Optional[str], operation: str,
+                          params: Optional[Dict[str, Any]] = None, caption: str = "") -> Optional[Dict[str, Any]]:
+        """Resend a previously produced result, returning None on a miss"""
+        if not file_unique_id:
+            return None
+
+        key = result_key(file_unique_id, operation, params)
+        entry = await DatabaseOperations.get_cached_result(key)
+        if not entry:
+            return None
+
+        sender = getattr(bot, self.SENDERS[entry["media_type"]])
+        try:
+            await sender(chat_id, entry["file_id"], caption=caption)
+        except BadRequest as e:
+            # file_id no longer valid for this bot; forget it and process normally
+            logger.warning(f"Dropping stale cached result {key}: {e}")
+            await DatabaseOperations.delete_cached_result(key)
+            return None
+
+        return {"file_id": entry["file_id"], "cached": True}
+
+    async def store(self, file_unique_id: Optional[str], operation: str, params: Optional[Dict[str, Any]],
+                    media_type: str, file_id: str):
+        """Remember the file_id Telegram assigned to a result"""
+        if not file_unique_id:
+            return
+
+        try:
+            await DatabaseOperations.cache_result(
+                result_key(file_unique_id, operation, params),
+                file_unique_id, operation, media_type, file_id
+            )
+        except Exception as e:
+            logger.error(f"Failed to cache result for {operation}: {e}")
+
+# Singleton instance
+result_cache = ResultCache()
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from config import config
+
+logger = logging.getLogger(__name__)
+
+QueueCallback = Callable[[int, int], Awaitable[None]]
+
+# Expected output size as a multiple of the input size, until finished jobs
+# provide real ratios. The input itself is reserved separately when it has
+# to be downloaded.
+DISK_FACTORS: Dict[str, float] = {
+    "thumbnail": 0.01,
+    "extract_audio": 0.3,
+    "mute": 1.0
+}
+DEFAULT_DISK_FACTOR = 1.0
+
+class QueueFullError(Exception):
+    """Raised when a user already has the maximum number of jobs queued"""
+
+@dataclass
+class ScheduledJob:
+    job_id: str
+    user_id: int
+    action: str
+    func: Callable[..., Awaitable[Any]]
+    args: tuple
+    kwargs: dict
+    future: asyncio.Future
+    input_size: int = 0
+    queued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    task: Optional[asyncio.Task] = None  # the running call, once a worker has it
+
+class JobScheduler:
+    """Runs FFmpeg work on a fixed pool of workers instead of inside handlers"""
+
+    def __init__(self, workers: Optional[int] = None, per_user_limit: Optional[int] = None):
+        # MAX_CONCURRENT_JOBS caps the whole node as well as each user
+        self.workers = workers or max(1, min(config.FFMPEG_WORKERS, config.MAX_CONCURRENT_JOBS))
+        self.per_user_limit = per_user_limit or config.MAX_CONCURRENT_JOBS
+        self._queue: Deque[ScheduledJob] = deque()
+        self._running: Dict[str, ScheduledJob] = {}
+        self._user_jobs: Dict[int, int] = {}
+        self._durations: Dict[str, float] = {}
+        self._disk_ratios: Dict[str, float] = {}
+        self._available: Optional[asyncio.Semaphore] = None
+        self._disk_waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self._tasks: List[asyncio.Task] = []
+        self.disk_budget = config.DISK_BUDGET
+        self.disk_reserved = 0
+
+    async def start(self):
+        """Start worker tasks"""
+        if self._tasks:
+            return
+        if self._available is None:
+            self._available = asyncio.Semaphore(0)
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+        logger.info(f"Job scheduler started with {self.workers} workers")
+
+    async def stop(self):
+        """Stop workers and cancel queued jobs"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        while self._queue:
+            job = self._queue.popleft()
+            job.future.cancel()
+            self._release(job)
+
+    def submit(self, user_id: int, action: str, func: Callable[..., Awaitable[Any]],
+               *args, input_size: int = 0, **kwargs) -> ScheduledJob:
+        """Queue a coroutine function for execution on a worker.
+
+        `input_size` is the size of the file being processed, used to learn
+        each action's output/input ratio for reserve().
+        """
+        if self._user_jobs.get(user_id, 0) >= self.per_user_limit:
+            raise QueueFullError(f"Too many active jobs (max {self.per_user_limit})")
+
+        job = ScheduledJob(
+            job_id=uuid.uuid4().hex,
+            user_id=user_id,
+            action=action,
+            func=func,
+            args=args,
+            kwargs=kwargs,
+            future=asyncio.get_running_loop().create_future(),
+            input_size=input_size
+        )
+        self._queue.append(job)
+        self._user_jobs[user_id] = self._user_jobs.get(user_id, 0) + 1
+        if self._available is None:
+            self._available = asyncio.Semaphore(0)
+        self._available.release()
+        return job
+
+    async def run(self, user_id: int, action: str, func: Callable[..., Awaitable[Any]],
+                  *args, on_queued: Optional[QueueCallback] = None,
+                  poll_interval: float = 5.0, input_size: int = 0, **kwargs) -> Any:
+        """Submit a job and wait for its result, reporting queue position while waiting"""
+        job = self.submit(user_id, action, func, *args, input_size=input_size, **kwargs)
+        last_position = None
+
+        try:
+            while not job.future.done():
+                position = self.position(job)
+                if position and position != last_position and on_queued:
+                    try:
+                        await on_queued(position, self.eta(job))
+                    except Exception as e:
+                        logger.warning(f"Queue status callback failed: {e}")
+                last_position = position
+                await asyncio.wait({job.future}, timeout=poll_interval)
+        except asyncio.CancelledError:
+            # A queued job is skipped by the worker that pops it; a running
+            # one is stopped, and waited for so its ffmpeg is gone before the
+            # caller removes the workspace it writes into
+            job.future.cancel()
+            if job.task is not None:
+                job.task.cancel()
+                await asyncio.wait({job.task})
+            raise
+
+        return job.future.result()
+
+    def position(self, job: ScheduledJob) -> int:
+        """1-based position in queue, or 0 once the job is running"""
+        for index, queued in enumerate(self._queue):
+            if queued is job:
+                return index + 1
+        return 0
+
+    def estimate(self, action: str) -> float:
+        """Expected run time for an action"""
+        return self._durations.get(action, config.DEFAULT_JOB_ESTIMATE)
+
+    def estimate_disk(self, action: str, input_size: int) -> int:
+        """Expected output size for an action on an input of this size"""
+        ratio = self._disk_ratios.get(action, DISK_FACTORS.get(action, DEFAULT_DISK_FACTOR))
+        return int(input_size * ratio)
+
+    def eta(self, job: ScheduledJob) -> int:
+        """Seconds until the job is expected to finish"""
+        now = time.monotonic()
+        backlog = sum(
+            max(self.estimate(running.action) - (now - running.started_at), 0)
+            for running in self._running.values()
+        )
+        for queued in self._queue:
+            if queued is job:
+                break
+            backlog += self.estimate(queued.action)
+
+        return int(backlog / self.workers + self.estimate(job.action))
+
+    def stats(self) -> Dict[str, int]:
+        """Current scheduler load"""
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "queued": len(self._queue),
+            "disk_reserved": self.disk_reserved,
+            "disk_budget": self.disk_budget
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            await self._available.acquire()
+            job = self._queue.popleft()
+
+            # Submitter gave up before a worker was free
+            if job.future.done():
+                self._release(job)
+                continue
+
+            job.started_at = time.monotonic()
+            self._running[job.job_id] = job
+            job.task = asyncio.create_task(job.func(*job.args, **job.kwargs))
+            try:
+                # wait() returns when the call ends, including when run()
+                # cancels it; only the worker's own cancellation raises here
+                await asyncio.wait({job.task})
+            except asyncio.CancelledError:
+                job.task.cancel()
+                job.future.cancel()
+                raise
+            finally:
+                del self._running[job.job_id]
+                self._release(job)
+
+            if job.task.cancelled():
+                job.future.cancel()
+            elif job.task.exception() is not None:
+                if not job.future.done():
+                    job.future.set_exception(job.task.exception())
+            else:
+                result = job.task.result()
+                if not job.future.done():
+                    job.future.set_result(result)
+                self._record_duration(job)
+                self._record_disk(job, result)
+
+    @asynccontextmanager
+    async def reserve(self, action: str, input_size: int, download: bool = True) -> AsyncIterator[None]:
+        """Hold disk budget for a job's input download and outputs while the block runs.
+
+        Wrap the fetch as well as the job, so a burst of large uploads waits
+        here instead of all downloading at once. Reservations are granted in
+        arrival order: a large one waits for space rather than being
+        overtaken indefinitely by smaller ones.
+        """
+        amount = self.estimate_disk(action, input_size) + (input_size if download else 0)
+        if not amount:
+            yield
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._disk_waiters.append((amount, waiter))
+        self._grant_disk()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                # Gave up while waiting; the line moves past the dead waiter
+                self._grant_disk()
+            else:
+                # Granted in the same tick we were cancelled
+                self._release_disk(amount)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release_disk(amount)
+
+    def _grant_disk(self):
+        """Hand out reservations from the head of the line while they fit"""
+        while self._disk_waiters:
+            amount, waiter = self._disk_waiters[0]
+            if waiter.done():
+                self._disk_waiters.popleft()
+                continue
+            if not self._fits(amount):
+                return
+            self._disk_waiters.popleft()
+            self.disk_reserved += amount
+            waiter.set_result(None)
+
+    def _release_disk(self, amount: int):
+        self.disk_reserved -= amount
+        self._grant_disk()
+
+    def _fits(self, amount: int) -> bool:
+        if not self.disk_budget:
+            # Default to most of what is free on the workspace volume right now
+            os.makedirs(config.WORKSPACE_DIR, exist_ok=True)
+            free = shutil.disk_usage(config.WORKSPACE_DIR).free
+            self.disk_budget = int(free * (1 - config.DISK_HEADROOM))
+        # A job bigger than the whole budget may still run on an idle node
+        return self.disk_reserved + amount <= self.disk_budget or self.disk_reserved == 0
+
+    def _record_duration(self, job: ScheduledJob):
+        elapsed = time.monotonic() - job.started_at
+        previous = self._durations.get(job.action)
+        # Exponential moving average keeps the ETA responsive to recent load
+        self._durations[job.action] = elapsed if previous is None else previous * 0.8 + elapsed * 0.2
+
+    def _record_disk(self, job: ScheduledJob, result: Any):
+        """Learn the real output/input ratio from the output file a job returned"""
+        if not job.input_size or not isinstance(result, str) or not os.path.isfile(result):
+            return
+        ratio = os.path.getsize(result) / job.input_size
+        previous = self._disk_ratios.get(job.action)
+        self._disk_ratios[job.action] = ratio if previous is None else previous * 0.8 + ratio * 0.2
+
+    def _release(self, job: ScheduledJob):
+        remaining = self._user_jobs.get(job.user_id, 0) - 1
+        if remaining > 0:
+            self._user_jobs[job.user_id] = remaining
+        else:
+            self._user_jobs.pop(job.user_id, None)
+
+# Singleton instance
+scheduler = JobScheduler()
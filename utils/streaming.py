@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+import aiohttp
+from telegram import Message
+from config import config
+from utils.ffmpeg_utils import FFmpegError, FFmpegHandler, ProgressCallback, redact
+from utils.rate_limiter import LANE_UPLOAD, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Muxer arguments for outputs that can be written to a non-seekable pipe
+STREAM_FORMATS: Dict[str, List[str]] = {
+    "mp3": ['-f', 'mp3'],
+    "aac": ['-f', 'adts'],
+    "m4a": ['-f', 'ipod', '-movflags', 'frag_keyframe+empty_moov'],
+    "opus": ['-f', 'opus'],
+    "ogg": ['-f', 'ogg'],
+    "flac": ['-f', 'flac'],
+    "wav": ['-f', 'wav'],
+    "mp4": ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+}
+
+MIME_TYPES: Dict[str, str] = {
+    "mp3": "audio/mpeg",
+    "aac": "audio/aac",
+    "m4a": "audio/mp4",
+    "opus": "audio/opus",
+    "ogg": "audio/ogg",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "mp4": "video/mp4"
+}
+
+class StreamingPipeline:
+    """Telegram file → FFmpeg → Telegram upload without temp files.
+
+    FFmpeg reads the Bot API file URL itself (or the local path with a local
+    Bot API server) rather than from stdin, because MP4 uploads often keep
+    their moov atom at the end and can only be demuxed from a seekable input;
+    ffmpeg's HTTP reader seeks with range requests. Output goes to stdout and
+    is streamed into a chunked multipart upload, so disk usage is zero and
+    memory is bounded by the pipe buffers. With on_progress, `-progress` goes
+    to an extra pipe since stdout carries the media.
+    """
+
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self):
+        self.ffmpeg = config.FFMPEG_PATH
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # No total timeout: a large upload through a local Bot API server can
+        # take longer than aiohttp's default 300 s
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=config.STREAM_UPLOAD_READ_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def extract_audio(self, bot, chat_id: int, file_id: str, format: str = "mp3",
+                            bitrate: str = "192k", caption: str = "",
+                            on_progress: Optional[ProgressCallback] = None) -> Message:
+        """Extract the audio track and send it as audio"""
+        args = ['-vn', '-map', 'a', '-b:a', bitrate, *STREAM_FORMATS[format]]
+        return await self.run(bot, file_id, args, "sendAudio", "audio", f"audio.{format}",
+                              MIME_TYPES[format], on_progress, chat_id=chat_id, caption=caption)
+
+    async def remove_audio(self, bot, chat_id: int, file_id: str, caption: str = "",
+                           on_progress: Optional[ProgressCallback] = None) -> Message:
+        """Drop audio and send the video back, stream-copied"""
+        args = ['-c', 'copy', '-an', *STREAM_FORMATS["mp4"]]
+        return await self.run(bot, file_id, args, "sendVideo", "video", "video.mp4",
+                              MIME_TYPES["mp4"], on_progress, chat_id=chat_id, caption=caption,
+                              supports_streaming="true")
+
+    async def run(self, bot, file_id: str, output_args: List[str], method: str, field: str,
+                  filename: str, mime_type: str, on_progress: Optional[ProgressCallback] = None,
+                  **fields: Any) -> Message:
+        """Pipe FFmpeg output for a Telegram file straight into a Bot API upload"""
+        file = await bot.get_file(file_id)
+        cmd = [self.ffmpeg, '-hide_banner', '-nostdin', '-i', file.file_path, *output_args, 'pipe:1']
+
+        progress_read = progress_write = None
+        if on_progress:
+            # ffmpeg's pipe: protocol takes any inherited descriptor
+            progress_read, progress_write = os.pipe()
+            cmd = [cmd[0], '-progress', f'pipe:{progress_write}', '-nostats', *cmd[1:]]
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                pass_fds=(progress_write,) if on_progress else ()
+            )
+        except BaseException:
+            if on_progress:
+                os.close(progress_read)
+            raise
+        finally:
+            # The child holds its own copy; ours would keep the pipe open past exit
+            if on_progress:
+                os.close(progress_write)
+        stderr_tail: deque = deque(maxlen=config.FFMPEG_STDERR_LINES)
+
+        progress_task = progress_transport = None
+        if on_progress:
+            reader = asyncio.StreamReader()
+            progress_transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(progress_read, 'rb')
+            )
+            progress_task = asyncio.create_task(FFmpegHandler._read_progress(reader, on_progress))
+
+        async def output() -> AsyncIterator[bytes]:
+            while True:
+                chunk = await process.stdout.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+            # Fail the upload rather than let Telegram accept a truncated file
+            if await process.wait() != 0:
+                await stderr_task
+                stderr = "\n".join(stderr_tail)
+                raise FFmpegError(f"FFmpeg error: {redact(stderr, cmd)}")
+
+        stderr_task = asyncio.create_task(FFmpegHandler._read_lines(process.stderr, stderr_tail))
+        try:
+            return await self._upload(bot, method, field, filename, mime_type, output(), fields)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            stderr_task.cancel()
+            if progress_task:
+                progress_task.cancel()
+                progress_transport.close()
+
+    async def _upload(self, bot, method: str, field: str, filename: str, mime_type: str,
+                      body: AsyncIterator[bytes], fields: Dict[str, Any]) -> Message:
+        form = aiohttp.FormData()
+        for name, value in fields.items():
+            if value is not None:
+                form.add_field(name, str(value))
+        form.add_field(field, body, filename=filename, content_type=mime_type)
+
+        # Raw uploads bypass ExtBot, so take the limiter token here; the body
+        # can't be replayed, so a flood wait pauses the chat and fails this one
+        chat_id = fields.get("chat_id")
+        await rate_limiter.acquire(chat_id, LANE_UPLOAD)
+
+        async with self._get_session().post(f"{bot.base_url}/{method}", data=form) as response:
+            # A proxy or an overloaded server can answer with an HTML error page
+            if response.content_type != "application/json":
+                raise Exception(f"Upload failed: HTTP {response.status} ({response.content_type})")
+            payload = await response.json()
+
+        if not payload.get("ok"):
+            retry_after = payload.get("parameters", {}).get("retry_after")
+            if retry_after:
+                rate_limiter.pause(chat_id, retry_after)
+            raise Exception(f"Upload failed: {payload.get('description', response.status)}")
+        return Message.de_json(payload["result"], bot)
+
+# Singleton instance
+streaming = StreamingPipeline()
@@ -0,0 +1,190 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from config import config
+from database.models import MediaInfo
+from utils.download_cache import download_cache
+from utils.ffmpeg_utils import FFmpegHandler, ProgressCallback, redact
+from utils.media_info import media_info
+from utils.mtproto import mtproto, send_file
+from utils.result_cache import result_cache
+from utils.scheduler import scheduler, QueueCallback, QueueFullError
+from utils.streaming import streaming
+from utils.workspace import Workspace, workspaces
+
+logger = logging.getLogger(__name__)
+
+# Media tasks shared by the bot handlers (in-process) and worker.py (queued).
+# Each task fetches the input through the download cache, runs FFmpeg through
+# the scheduler and delivers the result to the chat, returning a small
+# JSON-safe result dict. Intermediate files live in a per-job workspace that is
+# removed however the task ends. on_progress, when given, receives the FFmpeg
+# progress events of the task's encode, streamed or not.
+
+@asynccontextmanager
+async def job_workspace(action: str, video_info: Dict[str, Any]) -> AsyncIterator[Workspace]:
+    """Reserve disk for the input download and outputs, then open a workspace.
+
+    The reservation covers the fetch, so a burst of large uploads queues here
+    instead of all downloading at once.
+    """
+    size = video_info.get('file_size') or 0
+    cached = download_cache.cached(video_info.get('file_unique_id'))
+    async with scheduler.reserve(action, size, download=not cached):
+        async with workspaces.job(action, size) as workspace:
+            yield workspace
+
+def use_streaming(action: str, video_info: Dict[str, Any]) -> bool:
+    """Whether an action's output should be piped straight into a Bot API upload.
+
+    A streamed output can only go to the Bot API, so one expected to be large
+    enough for MTProto is written to a workspace and sent through send_file.
+    """
+    if not config.STREAMING_PIPELINE:
+        return False
+    expected = scheduler.estimate_disk(action, video_info.get('file_size') or 0)
+    return not mtproto.should_use_size(expected)
+
+async def thumbnail_task(bot, chat_id: int, user_id: int, video_info: Dict[str, Any],
+                         on_queued: Optional[QueueCallback] = None,
+                         on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """Extract and send a thumbnail"""
+    unique_id = video_info.get('file_unique_id')
+    params = {"time": "00:00:01"}
+    caption = "✅ Thumbnail extracted!"
+
+    cached = await result_cache.send_cached(bot, chat_id, unique_id, "thumbnail", params, caption)
+    if cached:
+        return cached
+
+    async with job_workspace("thumbnail", video_info) as workspace:
+        async with download_cache.fetch(bot, video_info['file_id'], unique_id) as file_path:
+            ffmpeg = FFmpegHandler(on_progress, workdir=workspace.path)
+            thumbnail_path = await scheduler.run(
+                user_id, "thumbnail", ffmpeg.extract_thumbnail, file_path, params["time"],
+                on_queued=on_queued, input_size=video_info.get('file_size') or 0
+            )
+
+        with open(thumbnail_path, 'rb') as thumb:
+            message = await bot.send_photo(
+                chat_id=chat_id,
+                photo=thumb,
+                caption=caption
+            )
+
+    file_id = message.photo[-1].file_id
+    await result_cache.store(unique_id, "thumbnail", params, "photo", file_id)
+    return {"file_id": file_id}
+
+async def extract_audio_task(bot, chat_id: int, user_id: int, video_info: Dict[str, Any],
+                             on_queued: Optional[QueueCallback] = None,
+                             on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """Extract and send the audio track"""
+    unique_id = video_info.get('file_unique_id')
+    params = {"format": "mp3", "bitrate": "192k"}
+    caption = "✅ Audio extracted!"
+
+    cached = await result_cache.send_cached(bot, chat_id, unique_id, "extract_audio", params, caption)
+    if cached:
+        return cached
+
+    if use_streaming("extract_audio", video_info):
+        message = await scheduler.run(
+            user_id, "extract_audio", streaming.extract_audio, bot, chat_id, video_info['file_id'],
+            params["format"], params["bitrate"], caption=caption, on_progress=on_progress,
+            on_queued=on_queued
+        )
+    else:
+        async with job_workspace("extract_audio", video_info) as workspace:
+            async with download_cache.fetch(bot, video_info['file_id'], unique_id) as file_path:
+                ffmpeg = FFmpegHandler(on_progress, workdir=workspace.path)
+                audio_path = await scheduler.run(
+                    user_id, "extract_audio", ffmpeg.extract_audio, file_path,
+                    params["format"], params["bitrate"],
+                    on_queued=on_queued, input_size=video_info.get('file_size') or 0
+                )
+
+            message = await send_file(bot, chat_id, "audio", audio_path, caption)
+
+    await result_cache.store(unique_id, "extract_audio", params, "audio", message.audio.file_id)
+    return {"file_id": message.audio.file_id}
+
+async def mute_task(bot, chat_id: int, user_id: int, video_info: Dict[str, Any],
+                    on_queued: Optional[QueueCallback] = None,
+                    on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """Remove audio and send the video back"""
+    unique_id = video_info.get('file_unique_id')
+    caption = "✅ Audio removed!"
+
+    cached = await result_cache.send_cached(bot, chat_id, unique_id, "mute", caption=caption)
+    if cached:
+        return cached
+
+    if use_streaming("mute", video_info):
+        message = await scheduler.run(
+            user_id, "mute", streaming.remove_audio, bot, chat_id, video_info['file_id'],
+            caption=caption, on_progress=on_progress, on_queued=on_queued
+        )
+    else:
+        async with job_workspace("mute", video_info) as workspace:
+            async with download_cache.fetch(bot, video_info['file_id'], unique_id) as file_path:
+                ffmpeg = FFmpegHandler(on_progress, workdir=workspace.path)
+                muted_path = await scheduler.run(
+                    user_id, "mute", ffmpeg.remove_audio, file_path,
+                    on_queued=on_queued, input_size=video_info.get('file_size') or 0
+                )
+
+            message = await send_file(bot, chat_id, "video", muted_path, caption)
+
+    await result_cache.store(unique_id, "mute", None, "video", message.video.file_id)
+    return {"file_id": message.video.file_id}
+
+async def info_task(bot, chat_id: int, user_id: int, video_info: Dict[str, Any],
+                    on_queued: Optional[QueueCallback] = None,
+                    on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """Probe the video's container header; the caller decides how to show the text"""
+    info = await media_info.probe_remote(bot, video_info['file_id'], video_info['file_unique_id'])
+
+    return {"text": format_media_info(info)}
+
+def format_media_info(info: MediaInfo) -> str:
+    """Render probed media info as a Markdown message"""
+    video = info.video
+    audio = info.audio
+    return f"""
+        📊 *Media Information*
+
+        *General*:
+        • Format: {info.format_name or 'N/A'}
+        • Duration: {info.duration:.2f}s
+        • Size: {info.size // (1024*1024)} MB
+        • Bitrate: {info.bit_rate // 1000} kbps
+
+        *Video Stream*:
+        • Codec: {video.codec_name if video else 'N/A'}
+        • Resolution: {f"{video.width}x{video.height}" if video else 'N/A'}
+        • FPS: {video.fps if video else 0:.2f}
+
+        *Audio Stream*:
+        • Codec: {audio.codec_name if audio else 'N/A'}
+        • Channels: {audio.channels if audio else 'N/A'}
+        • Sample Rate: {audio.sample_rate if audio else 'N/A'} Hz
+        """
+
+def describe_error(error: Exception) -> str:
+    """What to tell the user about a failed task.
+
+    Exception text can carry Bot API file URLs, and with them the bot token,
+    so only errors meant for users are shown verbatim; the rest is logged.
+    """
+    if isinstance(error, QueueFullError):
+        return f"❌ {error}"
+    logger.error(f"Task failed: {redact(str(error))}")
+    return "❌ Processing failed. Please try again later."
+
+TASKS: Dict[str, Callable[..., Awaitable[Dict[str, Any]]]] = {
+    "thumbnail": thumbnail_task,
+    "extract_audio": extract_audio_task,
+    "mute": mute_task,
+    "info": info_task
+}
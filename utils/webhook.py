@@ -0,0 +1,63 @@
+from collections import deque
+from typing import Any, Awaitable, Deque, Optional, Set
+from telegram import Update
+from telegram.ext import SimpleUpdateProcessor
+from config import config
+
+class RecentUpdates:
+    """Sliding window of the most recent update_ids.
+
+    Telegram redelivers an update when the webhook answers slowly or with an
+    error, so the same update_id can arrive more than once. Only the last
+    WEBHOOK_DEDUP_WINDOW ids are remembered, which bounds memory while
+    covering Telegram's retry horizon by a wide margin.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or config.WEBHOOK_DEDUP_WINDOW
+        self._order: Deque[int] = deque()
+        self._seen: Set[int] = set()
+        self.duplicates = 0
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self._seen
+
+    def add(self, update_id: int):
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.size:
+            self._seen.discard(self._order.popleft())
+
+    def duplicate(self, update_id: int) -> bool:
+        """Whether an update_id was already accepted; counts the drop if so"""
+        if update_id in self._seen:
+            self.duplicates += 1
+            return True
+        return False
+
+class TrackingUpdateProcessor(SimpleUpdateProcessor):
+    """Concurrent update processor that knows which webhook updates are unfinished.
+
+    With concurrent updates the application takes every update off its queue
+    at once and parks a task on the concurrency semaphore, so the queue length
+    says nothing about the backlog. An update counts from accept() until its
+    handlers return, covering the queue, the semaphore wait and the handlers.
+    """
+
+    def __init__(self, max_concurrent_updates: Optional[int] = None):
+        super().__init__(max_concurrent_updates or config.UPDATE_CONCURRENCY)
+        self._accepted: Set[int] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._accepted)
+
+    def accept(self, update_id: int):
+        self._accepted.add(update_id)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        try:
+            await coroutine
+        finally:
+            if isinstance(update, Update):
+                self._accepted.discard(update.update_id)
@@ -0,0 +1,104 @@
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from config import config
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = ".lock"
+STALE_UNLOCKED = 3600  # seconds before a workspace without a lock file counts as orphaned
+
+class Workspace:
+    """A private scratch directory for one job"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+class WorkspaceManager:
+    """Creates per-job directories and guarantees they are removed.
+
+    Each workspace holds an exclusive flock on its ``.lock`` file for as long
+    as the job runs. The lock dies with the process, so a sweep can tell a
+    workspace left behind by a crash from one still in use by another bot or
+    worker process sharing the directory.
+    """
+
+    def __init__(self, root: Optional[str] = None, tmpfs_root: Optional[str] = None,
+                 tmpfs_max_size: Optional[int] = None):
+        self.root = root or config.WORKSPACE_DIR
+        self.tmpfs_root = tmpfs_root if tmpfs_root is not None else config.WORKSPACE_TMPFS_DIR
+        self.tmpfs_max_size = tmpfs_max_size or config.WORKSPACE_TMPFS_MAX_SIZE
+
+    def _base(self, size_hint: int) -> str:
+        """tmpfs for small inputs when configured and it has room, disk otherwise"""
+        if self.tmpfs_root and 0 < size_hint <= self.tmpfs_max_size:
+            base = os.path.join(self.tmpfs_root, "mediabot")
+            try:
+                os.makedirs(base, exist_ok=True)
+                # Outputs can be a few times the input; keep headroom for them
+                if shutil.disk_usage(base).free > size_hint * 4:
+                    return base
+            except OSError as e:
+                logger.warning(f"tmpfs workspace unavailable: {e}")
+        os.makedirs(self.root, exist_ok=True)
+        return self.root
+
+    @asynccontextmanager
+    async def job(self, prefix: str = "job", size_hint: int = 0) -> AsyncIterator[Workspace]:
+        """Yield a fresh workspace; it is deleted on success, error or cancellation"""
+        path = tempfile.mkdtemp(prefix=f"{prefix}_", dir=self._base(size_hint))
+        lock_fd = os.open(os.path.join(path, LOCK_NAME), os.O_CREAT | os.O_RDWR, 0o644)
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        try:
+            yield Workspace(path)
+        finally:
+            # Synchronous on purpose: a second cancellation can't interrupt it
+            shutil.rmtree(path, ignore_errors=True)
+            os.close(lock_fd)
+
+    def sweep(self) -> int:
+        """Remove workspaces whose owning process is gone"""
+        removed = 0
+        roots = [self.root]
+        if self.tmpfs_root:
+            roots.append(os.path.join(self.tmpfs_root, "mediabot"))
+
+        for root in roots:
+            if not os.path.isdir(root):
+                continue
+            for entry in os.scandir(root):
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                try:
+                    lock_fd = os.open(os.path.join(entry.path, LOCK_NAME), os.O_RDWR)
+                except FileNotFoundError:
+                    # Either just created and not locked yet, or a crash in that window
+                    if time.time() - entry.stat().st_mtime > STALE_UNLOCKED:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        removed += 1
+                    continue
+                except OSError:
+                    continue
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(lock_fd)
+                    continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+                os.close(lock_fd)
+                removed += 1
+
+        if removed:
+            logger.info(f"Removed {removed} orphaned workspaces")
+        return removed
+
+# Singleton instance
+workspaces = WorkspaceManager()
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Dict, Any
+from telegram.ext import ExtBot
+
+from config import config
+from database.storage import get_storage, close_storage
+from database.operations import DatabaseOperations
+from database.settings_cache import settings_cache
+from database.write_behind import write_behind
+from utils.downloader import downloader
+from utils.mtproto import mtproto
+from utils.progress import progress
+from utils.rate_limiter import rate_limiter
+from utils.scheduler import scheduler
+from utils.streaming import streaming
+from utils.ffmpeg_utils import redact
+from utils.tasks import TASKS, describe_error
+from utils.workspace import workspaces
+
+# Configure logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+class MediaWorker:
+    """Consumes pending jobs from MongoDB so the webhook process never runs FFmpeg"""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.bot = ExtBot(
+            config.BOT_TOKEN,
+            base_url=f"{config.BOT_API_URL}/bot",
+            base_file_url=f"{config.BOT_API_URL}/file/bot",
+            local_mode=config.BOT_API_LOCAL_MODE,
+            rate_limiter=rate_limiter
+        )
+        self.active: Dict[str, asyncio.Task] = {}
+        self.running = False
+
+    async def run(self):
+        """Claim and process jobs until stopped"""
+        await get_storage()
+        workspaces.sweep()
+        settings_cache.start()
+        write_behind.start()
+        await self.bot.initialize()
+        progress.bind(self.bot)
+        await scheduler.start()
+
+        self.running = True
+        reaper = asyncio.create_task(self.requeue_loop())
+        logger.info(f"Worker {self.worker_id} started")
+
+        try:
+            while self.running:
+                # Only lease as many jobs as we have FFmpeg slots for
+                if len(self.active) >= scheduler.workers:
+                    await asyncio.wait(self.active.values(), return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                job = await DatabaseOperations.claim_job(self.worker_id, config.JOB_LEASE_SECONDS)
+                if not job:
+                    await asyncio.sleep(config.WORKER_POLL_INTERVAL)
+                    continue
+
+                task = asyncio.create_task(self.process(job))
+                self.active[job["job_id"]] = task
+                task.add_done_callback(lambda _, job_id=job["job_id"]: self.active.pop(job_id, None))
+        finally:
+            reaper.cancel()
+            await self.shutdown()
+
+    async def process(self, job: Dict[str, Any]):
+        """Run one leased job and write its outcome back"""
+        job_id = job["job_id"]
+        chat_id = job.get("chat_id")
+        heartbeat = asyncio.create_task(self.heartbeat(job_id, asyncio.current_task()))
+        started = time.monotonic()
+        status = None
+
+        try:
+            task = TASKS.get(job["action"])
+            if task is None:
+                raise Exception(f"Unknown action: {job['action']}")
+
+            result = await task(self.bot, chat_id, job["user_id"], job.get("params", {}))
+            if result.get("text"):
+                await self.bot.send_message(chat_id=chat_id, text=result["text"], parse_mode="Markdown")
+
+            if await DatabaseOperations.finish_job(job_id, self.worker_id, "completed", result=result):
+                status = "completed"
+        except asyncio.CancelledError:
+            # Lease lost or shutting down; the job will be picked up again
+            raise
+        except Exception as e:
+            error = redact(str(e))
+            logger.error(f"Job {job_id} failed: {error}")
+            if await DatabaseOperations.finish_job(job_id, self.worker_id, "failed", error=error):
+                status = "failed"
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=describe_error(e))
+            except Exception as notify_error:
+                logger.error(f"Could not notify chat {chat_id}: {notify_error}")
+        finally:
+            heartbeat.cancel()
+            if status:
+                await DatabaseOperations.add_history(
+                    job["user_id"], job["action"], job["file_type"],
+                    job.get("params", {}).get("file_size", 0), status,
+                    time.monotonic() - started
+                )
+
+    async def heartbeat(self, job_id: str, task: asyncio.Task):
+        """Keep the lease alive; cancel the job if another worker took it over"""
+        while True:
+            await asyncio.sleep(config.JOB_LEASE_SECONDS / 3)
+            try:
+                owned = await DatabaseOperations.heartbeat_job(job_id, self.worker_id, config.JOB_LEASE_SECONDS)
+            except Exception as e:
+                logger.warning(f"Heartbeat for job {job_id} failed: {e}")
+                continue
+            if not owned:
+                logger.warning(f"Lost lease on job {job_id}, abandoning it")
+                task.cancel()
+                return
+
+    async def requeue_loop(self):
+        """Return jobs from crashed workers to the queue"""
+        while True:
+            try:
+                requeued = await DatabaseOperations.requeue_expired_jobs(config.JOB_MAX_ATTEMPTS)
+                if requeued:
+                    logger.info(f"Requeued {requeued} jobs with expired leases")
+            except Exception as e:
+                logger.error(f"Error requeueing jobs: {e}")
+            await asyncio.sleep(config.JOB_LEASE_SECONDS)
+
+    async def shutdown(self):
+        """Give leased jobs back so other workers can start them immediately"""
+        self.running = False
+        active = list(self.active.items())
+        for job_id, task in active:
+            task.cancel()
+            await DatabaseOperations.release_job(job_id, self.worker_id)
+        await asyncio.gather(*(task for _, task in active), return_exceptions=True)
+        await scheduler.stop()
+        await settings_cache.stop()
+        await write_behind.stop()
+        await close_storage()
+        await downloader.close()
+        await streaming.close()
+        await mtproto.stop()
+        await self.bot.shutdown()
+        logger.info(f"Worker {self.worker_id} stopped")
+
+async def main():
+    """Worker entry point"""
+    worker = MediaWorker()
+    main_task = asyncio.current_task()
+    stopping = False
+
+    def on_sigterm():
+        # Process managers stop workers with SIGTERM; cancelling unwinds
+        # run() through shutdown(), which releases leased jobs right away.
+        # A repeated signal must not interrupt that shutdown.
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.info("SIGTERM received, shutting down")
+        worker.running = False
+        main_task.cancel()
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, on_sigterm)
+
+    try:
+        await worker.run()
+    except asyncio.CancelledError:
+        logger.info("Worker stopped")
+    except KeyboardInterrupt:
+        logger.info("Worker stopped by user")
+    except Exception as e:
+        logger.error(f"Worker crashed: {e}")
+
+if __name__ == "__main__":
+    asyncio.run(main())